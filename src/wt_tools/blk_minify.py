@@ -1,10 +1,12 @@
 import argparse
+import glob
 import os.path
-from typing import AnyStr, Dict
+import sys
+from contextlib import nullcontext
+from typing import AnyStr, Dict, Iterator, Iterable, List, Optional, Tuple
 
-from lark import Lark
-
-from formats.common import blk_transformer, get_tool_path
+from formats.blk_text import BlkSyntaxError, is_blank, iter_minify
+from formats.common import get_blk_parser
 
 strip_options = {
     'strip_empty_objects': False,
@@ -13,18 +15,153 @@ strip_options = {
 }
 
 
-def minify(blk_data: AnyStr, minify_options: Dict[AnyStr, bool]) -> AnyStr:
-    grammar_path = 'blk.lark'
-    blk_parser = Lark(open(os.path.join(get_tool_path(), grammar_path)).read(), parser='lalr',
-                      transformer=blk_transformer(minify_options), keep_all_tokens=True)
+engines = ('lark', 'fast')
+
+
+def minify(blk_data: AnyStr, minify_options: Dict[AnyStr, bool], engine: str = 'lark') -> AnyStr:
+    if engine == 'fast':
+        return ''.join(iter_minify(blk_data, minify_options))
+    # grammar needs at least one statement, text without them is minified to empty one, same as by fast engine
+    if is_blank(blk_data):
+        return ''
+    return get_blk_parser(minify_options).parse(blk_data)
+
+
+def iter_minify_chunks(blk_data: AnyStr, minify_options: Dict[AnyStr, bool], engine: str = 'lark') -> Iterator[str]:
+    """
+    Minify blk data, and return iterator over chunks of output. Only `fast` engine really streams output, `lark` one
+    returns it as one chunk.
+    """
+    if engine == 'fast':
+        return iter_minify(blk_data, minify_options)
+    return iter((minify(blk_data, minify_options, engine),))
+
+
+def syntax_errors(engine: str) -> Tuple[type, ...]:
+    """
+    Exceptions of engine on wrong blk text, lark is imported only for lark engine, it's slow to import.
+    """
+    if engine == 'fast':
+        return (BlkSyntaxError,)
+    from lark import LarkError
+    return BlkSyntaxError, LarkError
+
 
-    return blk_parser.parse(blk_data)
+def minify_file(filename: os.PathLike, out_filename: os.PathLike, minify_options: Dict[str, bool],
+                engine: str = 'lark') -> Tuple[int, int]:
+    """
+    Minify blk file to `out_filename`, return sizes of source and minified files.
+    """
+    # get size, as we get it wrong from text opened file
+    parsed_file_size = os.path.getsize(filename)
+    out_dir = os.path.dirname(out_filename)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    if parsed_file_size == 0:
+        with open(out_filename, 'wb') as f:
+            pass
+        return 0, 0
+    with open(filename, mode='r', encoding="utf8") as f:
+        data = f.read()
+
+    minified_size = 0
+    try:
+        with open(out_filename, 'w', encoding="utf8") as f:
+            for chunk in iter_minify_chunks(data, minify_options, engine):
+                f.write(chunk)
+                minified_size += len(chunk)
+    except syntax_errors(engine):
+        # don't leave partly written file
+        os.remove(out_filename)
+        raise
+    return parsed_file_size, minified_size
+
+
+def minify_file_logged(task: Tuple[str, str, Dict[str, bool], str]) -> Tuple[str, int, int, Optional[str]]:
+    """
+    Minify file, return its name, sizes and error message, if it failed, so workers don't stop on broken files.
+    """
+    filename, out_filename, minify_options, engine = task
+    try:
+        parsed_file_size, minified_size = minify_file(filename, out_filename, minify_options, engine)
+    except Exception as e:
+        return filename, 0, 0, '{}: {}'.format(type(e).__name__, e)
+    return filename, parsed_file_size, minified_size, None
+
+
+def init_worker(minify_options: Dict[str, bool], engine: str):
+    # build parser once per worker, not per file
+    if engine == 'lark':
+        get_blk_parser(minify_options)
+
+
+def iter_input_files(paths: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Yield blk files from files, folders and globs, with their paths relative to folder or to not glob part of path.
+    Files in folders are taken by `*.blk`, but not `*.min.blk`, so previous output near files is skipped.
+    """
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            files = []
+            for root, dirs, filenames in os.walk(path):
+                dirs.sort()
+                for name in sorted(filenames):
+                    if name.endswith('.blk') and not name.endswith('.min.blk'):
+                        files.append(os.path.join(root, name))
+            base = path
+        elif glob.has_magic(path):
+            files = [f for f in sorted(glob.glob(path, recursive=True)) if os.path.isfile(f)]
+            base = path
+            while glob.has_magic(base):
+                base = os.path.dirname(base)
+        else:
+            files = [path]
+            base = os.path.dirname(path)
+        for filename in files:
+            if filename not in seen:
+                seen.add(filename)
+                yield filename, os.path.relpath(filename, base or os.curdir)
+
+
+def minify_files(tasks: List[Tuple[str, str, Dict[str, bool], str]], jobs: int = 1) -> Tuple[int, int, int, int]:
+    """
+    Minify files by `minify_file_logged` tasks, in `jobs` worker processes, print errors.
+    Return number of minified files, their total sizes before and after and number of failed files.
+    """
+    if jobs > 1 and len(tasks) > 1:
+        jobs = min(jobs, len(tasks))
+        chunksize = max(1, min(16, len(tasks) // (jobs * 4)))
+        # all tasks have same options and engine
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs, initializer=init_worker, initargs=tasks[0][2:])
+        results = pool.imap(minify_file_logged, tasks, chunksize)
+    else:
+        pool = nullcontext()
+        results = map(minify_file_logged, tasks)
+
+    files_count = total_size = minified_size = failed_count = 0
+    with pool:
+        for filename, parsed_file_size, minified_file_size, error in results:
+            if error:
+                print("Failed to minify {}: {}".format(filename, error))
+                failed_count += 1
+            else:
+                files_count += 1
+                total_size += parsed_file_size
+                minified_size += minified_file_size
+    return files_count, total_size, minified_size, failed_count
 
 
 def main():
     parser = argparse.ArgumentParser(description="minify blk")
-    parser.add_argument('filename', help="blk file")
-    parser.add_argument("-O", dest='out_filename', default=False, nargs='?', help="output file")
+    parser.add_argument('paths', nargs='+', metavar='path', help="blk file, folder or glob, like `missions/**/*.blk`")
+    parser.add_argument("-O", dest='out_filename', default=False, nargs='?', help="output file, for one blk file")
+    parser.add_argument('--out_dir', '--out-dir', dest='out_dir', default=None,
+                        help="output folder, files are placed in it with same paths, as in source folder; "
+                             "by default *.min.blk file is written near every file")
+    parser.add_argument('--jobs', dest='jobs', type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes, by default number of CPUs")
     # removes not all empty objects, really
     parser.add_argument('--strip_empty_objects', dest='strip_empty_objects', action="store_true",
                         default=False, help="remove empty objects")
@@ -33,51 +170,56 @@ def main():
                         default=False, help="remove comment objects")
     parser.add_argument('--strip_disabled_objects', dest='strip_disabled_objects', action="store_true",
                         default=False, help="remove disabled objects")
+    parser.add_argument('--engine', dest='engine', choices=engines, default='lark',
+                        help="lark grammar parser, or fast hand-written one, which streams output")
     parser.add_argument('--strip_all', dest='strip_all', action="store_true",
                         default=False, help="select all options")
     parse_result = parser.parse_args()
 
-    filename = parse_result.filename
-
-    out_filename = ''
-    if parse_result.out_filename:
-        out_filename = parse_result.out_filename
-    else:
-        f_path, f_ext = os.path.splitext(filename)
-        out_filename = f_path + '.min' + f_ext
-
+    minify_options = dict(strip_options)
     if parse_result.strip_all:
-        for option in strip_options:
-            strip_options[option] = True
+        for option in minify_options:
+            minify_options[option] = True
 
     if parse_result.strip_empty_objects:
-        strip_options['strip_empty_objects'] = True
+        minify_options['strip_empty_objects'] = True
 
     if parse_result.strip_comment_objects:
-        strip_options['strip_comment_objects'] = True
+        minify_options['strip_comment_objects'] = True
 
     if parse_result.strip_disabled_objects:
-        strip_options['strip_disabled_objects'] = True
+        minify_options['strip_disabled_objects'] = True
 
-    if not os.path.exists(filename):
-        print("File", filename, "not exist")
-        return
-    # get size, as we get it wrong from text opened file
-    parsed_file_size = os.path.getsize(filename)
-    if parsed_file_size == 0:
-        with open(out_filename, 'wb') as f:
-            pass
-        return
-    with open(filename, mode='r', encoding="utf8") as f:
-        data = f.read()
+    for path in parse_result.paths:
+        if not glob.has_magic(path) and not os.path.exists(path):
+            print("File", path, "not exist")
+            return
+
+    input_files = list(iter_input_files(parse_result.paths))
+    if parse_result.out_filename:
+        if len(parse_result.paths) != 1 or not os.path.isfile(parse_result.paths[0]):
+            parser.error("-O can be used only with one file, use --out_dir for few files")
+        out_filenames = [parse_result.out_filename]
+    elif parse_result.out_dir:
+        out_filenames = [os.path.join(parse_result.out_dir, rel_path) for _, rel_path in input_files]
+    else:
+        out_filenames = []
+        for filename, _ in input_files:
+            f_path, f_ext = os.path.splitext(filename)
+            out_filenames.append(f_path + '.min' + f_ext)
 
-    parsed_data = minify(data, strip_options)
-    with open(out_filename, 'w', encoding="utf8") as f:
-        f.write(parsed_data)
-    print("minified {} from {} to {}, with rate {:.2}".format(filename,
-                                                              parsed_file_size, len(parsed_data),
-                                                              len(parsed_data) / parsed_file_size))
+    tasks = [(filename, out_filename, minify_options, parse_result.engine)
+             for (filename, _), out_filename in zip(input_files, out_filenames)]
+    files_count, total_size, minified_size, failed_count = minify_files(tasks, max(1, parse_result.jobs))
+    print("minified {} files from {} to {}, with rate {:.2}".format(
+        files_count, total_size, minified_size, minified_size / total_size if total_size else 1.0))
+    if failed_count:
+        print("failed to minify {} files".format(failed_count))
+        sys.exit(1)
 
 
 if __name__ == '__main__':
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
     main()
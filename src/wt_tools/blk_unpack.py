@@ -1,16 +1,21 @@
-import json
+import io
 import os.path
 import re
 import struct
-import uuid
+import sys
 import zlib
+from array import array
 from collections import OrderedDict
-from typing import Tuple, List, Iterable, Any, Dict
+from contextlib import redirect_stdout
+from json.encoder import encode_basestring
+from operator import itemgetter
+from traceback import print_exc
+from typing import Tuple, List, Any, Dict, Optional, Callable, TextIO, Iterator
 
 import click
-from lark import Lark, LarkError
 
-from formats.common import get_tool_path
+from formats.blk_cache import BlkCache, DEFAULT_MAX_SIZE, get_default_cache_dir
+from formats.common import get_blk_parser
 
 type_list = {
     0x0: 'size', 0x1: 'str', 0x2: 'int', 0x3: 'float', 0x4: 'vec2f',
@@ -29,7 +34,51 @@ type_list_strict_blk = {
 
 quotless_variable_name = re.compile(r"^[\w\.\-]+$")
 
-blk_parser = None
+block_id_w_type_struct = struct.Struct('<HxB')
+
+# 'bool' and 'typex' values are stored inside block id
+bool_types = (0x9, 0x89)
+
+# type byte: (precompiled struct for value, value offset from block id, offset to next block id, post-processing)
+block_value_structs: List[Optional[Tuple[struct.Struct, int, int, Optional[Callable]]]] = [None] * 0x100
+for _block_type, (_fmt, _value_offset, _next_offset, _post_process) in {
+    0x0: ('HH', 0x4, 0x8, None),  # 'size': [xxyy], xx - flat size, yy - group num
+    0x1: ('I', 0x4, 0x8, itemgetter(0)),  # 'str'
+    0x2: ('i', 0x4, 0x8, itemgetter(0)),  # 'int'
+    0x3: ('f', 0x4, 0x8, itemgetter(0)),  # 'float'
+    0x4: ('ff', 0x4, 0xc, None),  # 'vec2f'
+    0x5: ('fff', 0x4, 0x10, list),  # 'vec3f'
+    0x6: ('ffff', 0x4, 0x14, None),  # 'vec4f'
+    0x7: ('II', 0x4, 0xc, None),  # 'vec2i'
+    0x8: ('III', 0x4, 0x10, None),  # 'vec3i'
+    0x9: ('B', 0x2, 0x4, itemgetter(0)),  # 'bool'
+    0xa: ('I', 0x4, 0x8, itemgetter(0)),  # 'color', color code, like #6120f00
+    0xb: ('12f', 0x4, 0x34, lambda v: [list(v[0:3]), list(v[3:6]), list(v[6:9]), list(v[9:12])]),  # 'm4x3f'
+    0xc: ('II', 0x4, 0xc, None),  # 'time', unixtime
+    0x10: ('I', 0x4, 0x8, itemgetter(0)),  # 'typex7', what type?
+    0x89: ('B', 0x2, 0x4, itemgetter(0)),  # 'typex', reversed 'bool'
+}.items():
+    block_value_structs[_block_type] = (struct.Struct('<' + _fmt), _value_offset, _next_offset, _post_process)
+
+# one statement of text blk: `name:type=value`, `name{` or `}`
+text_blk_statement = re.compile(rb"""
+    (?:
+        (?:[\w\-.][\w\-./]*|"[^"\n]+")\s*
+        (?:
+            :\s*(?:i64|p2|p3|p4|ip2|ip3|b|c|m|t|i|r)\s*=[ \t\f]*
+            # numbers list can be empty, like `density:r=`
+            (?:"[^"]*"|'[^']*'|yes|no|true|false|\[[\d\s.,\-+eE\[\]]*\]|(?:[\d.\-+eE]+(?:\s*,\s*[\d.\-+eE]+)*)?)
+            |\{
+        )
+        |\}
+    )""", re.VERBOSE)
+text_blk_separators = re.compile(rb'(?:\s|;|//[^\n]*(?:\n|$))*')
+text_blk_control_chars = re.compile(rb'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+# size of data start, checked for text blk
+SNIFF_SIZE = 4096
+
+# number of written pieces (json tokens or blk lines), joined to one chunk of output
+OUTPUT_CHUNK_SIZE = 1 << 12
 
 
 class WrongFiletypeError(RuntimeError):
@@ -47,36 +96,69 @@ class NotPackedBLKError(RuntimeError):
     def __init__(self, arg):
         self.param = arg
 
-# https://stackoverflow.com/questions/13249415
-# using private interface
-class NoIndent(object):
-    def __init__(self, value):
-        self.value = value
 
-    def __repr__(self):
-        return repr(self.value)
+class BlkTree:
+    """
+    Decoded blk, independent of output format: parallel arrays of params and blocks.
+
+    Block 0 is root. Block params are `block_params_counts[i]` params from `block_first_params[i]`, block children
+    are `block_children_counts[i]` block ids from `block_first_children[i]` in `child_ids`. Names are stored as ids in
+    `names`, param values are read from file (strings are already decoded), but not converted to output form yet.
+    """
+    __slots__ = ('names', 'param_name_ids', 'param_types', 'param_values', 'block_name_ids', 'block_first_params',
+                 'block_params_counts', 'block_first_children', 'block_children_counts', 'child_ids')
+
+    def __init__(self, names: List[str]):
+        self.names = names
+        self.param_name_ids = array('I')
+        self.param_types = array('B')
+        self.param_values: List[Any] = []
+        self.block_name_ids = array('I')
+        self.block_first_params = array('I')
+        self.block_params_counts = array('I')
+        self.block_first_children = array('I')
+        self.block_children_counts = array('I')
+        self.child_ids = array('I')
+
+    def add_param(self, name_id: int, param_type: int, value):
+        self.param_name_ids.append(name_id)
+        self.param_types.append(param_type)
+        self.param_values.append(value)
+
+    def add_block(self, name_id: int) -> int:
+        """
+        Reserve block id, so blocks are numbered in order of appearance, content is set with `set_block_content`.
+        """
+        self.block_name_ids.append(name_id)
+        self.block_first_params.append(0)
+        self.block_params_counts.append(0)
+        self.block_first_children.append(0)
+        self.block_children_counts.append(0)
+        return len(self.block_name_ids) - 1
 
+    def set_block_content(self, block_id: int, first_param: int, params_count: int, children: List[int]):
+        self.block_first_params[block_id] = first_param
+        self.block_params_counts[block_id] = params_count
+        self.block_first_children[block_id] = len(self.child_ids)
+        self.block_children_counts[block_id] = len(children)
+        self.child_ids.extend(children)
 
-class NoIndentEncoder(json.JSONEncoder):
-    def __init__(self, *args, **kwargs):
-        super(NoIndentEncoder, self).__init__(*args, **kwargs)
-        self.kwargs = dict(kwargs)
-        del self.kwargs['indent']
-        self._replacement_map = {}
+    def params(self, block_id: int) -> range:
+        first_param = self.block_first_params[block_id]
+        return range(first_param, first_param + self.block_params_counts[block_id])
 
-    def default(self, o):
-        if isinstance(o, NoIndent):
-            key = uuid.uuid4().hex
-            self._replacement_map[key] = json.dumps(o.value, **self.kwargs)
-            return "@@%s@@" % (key,)
-        else:
-            return super(NoIndentEncoder, self).default(o)
+    def children(self, block_id: int) -> array:
+        first_child = self.block_first_children[block_id]
+        return self.child_ids[first_child:first_child + self.block_children_counts[block_id]]
 
-    def encode(self, o):
-        result = super(NoIndentEncoder, self).encode(o)
-        for k, v in self._replacement_map.items():
-            result = result.replace('"@@%s@@"' % (k,), v)
-        return result
+    def is_empty(self, block_id: int) -> bool:
+        return self.block_params_counts[block_id] == 0 and self.block_children_counts[block_id] == 0
+
+    def block_name(self, block_id: int) -> str:
+        return self.names[self.block_name_ids[block_id]]
+
+    def param_name(self, param_id: int) -> str:
+        return self.names[self.param_name_ids[param_id]]
 
 
 class BLK:
@@ -93,12 +175,48 @@ class BLK:
         self.num_of_units_in_file = 0
         self.ids_w_names: Dict[int, str] = dict()  # {key_id: key_string} for keys
         self.blk_version = 0  # 2 for 1.45 and lower, 3 for 1.47
+        self.tree: Optional[BlkTree] = None
 
     def unpack(self, out_type=output_type['json'], is_sorted=False) -> str:
-        # check file header and version
-        # TODO: error handle
         # is_sorted - sort output by keys in json output only
+        return ''.join(self.iter_unpack(out_type, is_sorted))
+
+    def unpack_to(self, stream: TextIO, out_type=output_type['json'], is_sorted=False):
+        """
+        Write output to text stream by chunks, while formatting it.
+        """
+        for chunk in self.iter_unpack(out_type, is_sorted):
+            stream.write(chunk)
+
+    def iter_unpack(self, out_type=output_type['json'], is_sorted=False) -> Iterator[str]:
+        """
+        Decode blk and return chunks of output.
+        """
         self.output_type = out_type
+        tree = self.decode()
+        if self.output_type == BLK.output_type['json']:
+            return BlkJsonWriter(tree, 2, False, is_sorted).iter_chunks()
+        elif self.output_type == BLK.output_type['json_min']:
+            return BlkJsonWriter(tree, None, False, is_sorted).iter_chunks()
+        elif self.output_type == BLK.output_type['strict_blk']:
+            return iter_strict_blk_chunks(tree)
+        elif self.output_type == BLK.output_type['json_2']:
+            return BlkJsonWriter(tree, 2, True, is_sorted).iter_chunks()
+        else:
+            print("error out type: %s" % self.output_type)
+            exit(1)
+
+    def decode(self) -> BlkTree:
+        """
+        Decode blk once, result is reused by next `unpack` calls with any output format.
+        """
+        if self.tree is None:
+            self.tree = self._decode()
+        return self.tree
+
+    def _decode(self) -> BlkTree:
+        # check file header and version
+        # TODO: error handle
         magic = struct.unpack_from('4s', self.data, 0)[0]
         if magic not in [BLK.bbf_magic, BLK.bbz_magic]:
             raise NotPackedBLKError("Not packed blk file")
@@ -118,21 +236,7 @@ class BLK:
             unpacked_data = self._unpack_v3()
         else:
             raise TypeError('Unknown version %d' % self.blk_version)
-
-        if self.output_type == BLK.output_type['json']:
-            return json.dumps(unpacked_data, ensure_ascii=False, cls=NoIndentEncoder, indent=2, separators=(',', ': '),
-                              sort_keys=is_sorted)
-        elif self.output_type == BLK.output_type['json_min']:
-            return json.dumps(unpacked_data, ensure_ascii=False, cls=NoIndentEncoder, separators=(',', ':'),
-                              sort_keys=is_sorted)
-        elif self.output_type == BLK.output_type['strict_blk']:
-            return self.print_strict_blk(unpacked_data)
-        elif self.output_type == BLK.output_type['json_2']:
-            return json.dumps(unpacked_data, ensure_ascii=False, cls=NoIndentEncoder, indent=2, separators=(',', ': '),
-                              sort_keys=is_sorted)
-        else:
-            print("error out type: %s" % self.output_type)
-            exit(1)
+        return unpacked_data
 
     def _unpack_v2(self):
         self.num_of_units_in_file = struct.unpack_from('I', self.data, BLK.num_of_units_in_file_offset)[0]
@@ -270,35 +374,39 @@ class BLK:
         else:
             raise TypeError('Unknown block = {:x}'.format(header_type))
 
-    def parse_data(self, cur_p: int, sub_units_names: List[str]):
+    def parse_data(self, cur_p: int, sub_units_names: List[bytes]) -> BlkTree:
         """
         Read main block of data and parse it.
 
         :param cur_p: pointer where to start
-        :return: list (or dict, if no duplicates) with {key_id: [key_type, key_value]} items
+        :return: decoded blk tree
         """
-        # TODO split parsing and output to json\blkx
+        tree = BlkTree(list(self.ids_w_names.values()))
+        self.name_ids = {key_id: i for i, key_id in enumerate(self.ids_w_names)}
         b_size, flat = self.read_first_header(cur_p)
         cur_p += 4
+        root_id = tree.add_block(0)
         if self.blk_version == 2:
-            full_data, cur_p = self.parse_inner(cur_p, b_size, sub_units_names)
+            self.parse_inner(tree, root_id, cur_p, b_size, sub_units_names)
         elif self.blk_version == 3:
-            full_data, cur_p = self.parse_inner_v3(cur_p, b_size, sub_units_names)
+            self.parse_inner_v3(tree, root_id, cur_p, b_size, sub_units_names)
         else:
             raise ValueError("unknown blk_version:", self.blk_version)
-        return full_data
+        return tree
 
     def read_first_header(self, offset: int) -> Tuple[Tuple[int, int], bool]:
         linear_units, group_num = struct.unpack_from('HH', self.data, offset)
         return (linear_units, group_num), True
 
-    def parse_inner(self, cur_p: int, b_size: Tuple[int, int], sub_units_names: List[str]):
-        # TODO: make class from it, drop ids_w_names, sub_units_names refs
-        if self.output_type == BLK.output_type['strict_blk']:
-            curr_block: Iterable = []
-        else:
-            curr_block = OrderedDict()
-        not_list = True  # flag for group_num == 0
+    def parse_inner(self, tree: BlkTree, block_id: int, cur_p: int, b_size: Tuple[int, int],
+                    sub_units_names: List[bytes]) -> int:
+        """
+        Add params and child blocks of block to tree, return pointer after block.
+        """
+        # params are stored before child blocks, so they follow one another in tree
+        first_param = len(tree.param_values)
+        params_count = 0
+        children: List[int] = []
         # print 'b_size', b_size
         while cur_p < len(self.data):
             flat_num, group_num = b_size
@@ -307,37 +415,34 @@ class BLK:
                     b_id, b_type = self.get_block_id_w_type(cur_p)
                     b_value, b_off = self.get_block_value(cur_p, b_type)
                     cur_p += b_off
-                    str_id, str_val = self.from_id_to_str(b_id, b_type, b_value, sub_units_names)
-                    curr_block, not_list = self.parse_inner_detect_take(not_list,
-                                                                        str_id, b_type,
-                                                                        str_val, curr_block)
+                    tree.add_param(self.name_ids[b_id], b_type, self.get_param_value(b_type, b_value, sub_units_names))
+                params_count += flat_num
                 b_size = (0, group_num)
             else:  # flat_num == 0
                 b_id, b_type = self.get_block_id_w_type(cur_p)
                 b_value, b_off = self.get_block_value(cur_p, b_type)
                 cur_p += b_off
+                child_id = tree.add_block(self.name_ids[b_id])
+                children.append(child_id)
                 if b_value != (0, 0):  # not empty group
-                    inner_block, cur_p = self.parse_inner(cur_p, b_value, sub_units_names)
-                else:
-                    inner_block = []
-                str_id, skip_block = self.from_id_to_str(b_id, b_type, b_value, sub_units_names)
-                curr_block, not_list = self.parse_inner_detect_take(not_list,
-                                                                    str_id, b_type,
-                                                                    inner_block, curr_block)
+                    cur_p = self.parse_inner(tree, child_id, cur_p, b_value, sub_units_names)
 
                 flat_num, group_num = b_size
                 b_size = (flat_num, group_num - 1)
             if b_size == (0, 0):
                 break
-        return curr_block, cur_p
+        tree.set_block_content(block_id, first_param, params_count, children)
+        return cur_p
 
-    def parse_inner_v3(self, cur_p: int, b_size: Tuple[int, int], sub_units_names: List[str]):
-        # TODO: make class from it, drop ids_w_names, sub_units_names refs
-        if self.output_type == BLK.output_type['strict_blk']:
-            curr_block: Iterable = []
-        else:
-            curr_block = OrderedDict()
-        not_list = True  # flag for group_num == 0
+    def parse_inner_v3(self, tree: BlkTree, block_id: int, cur_p: int, b_size: Tuple[int, int],
+                       sub_units_names: List[bytes]) -> int:
+        """
+        Add params and child blocks of block to tree, return pointer after block.
+        """
+        # params are stored before child blocks, so they follow one another in tree
+        first_param = len(tree.param_values)
+        params_count = 0
+        children: List[int] = []
         # print 'b_size, cur_p =', b_size, cur_p
         while cur_p < len(self.data):
             flat_num, group_num = b_size
@@ -345,208 +450,62 @@ class BLK:
                 id_list: List[Tuple] = []
                 for i in range(flat_num):
                     b_id, b_type = self.get_block_id_w_type(cur_p)
-                    b_value, b_off = self.get_block_value(cur_p, b_type)
+                    # other values are stored after block ids, read them in next cycle
+                    b_value = self.get_block_value(cur_p, b_type)[0] if b_type in bool_types else None
                     id_list.append((b_id, b_type, b_value))
                     cur_p += 4
                 # print id_list
                 # print 'cur_p start 2th cycle: %d' % cur_p
                 for b_id, b_type, b_value in id_list:
-                    if type_list[b_type] == 'bool' or type_list[b_type] == 'typex':
-                        str_id, str_val = self.from_id_to_str(b_id, b_type, b_value, sub_units_names)
-                        curr_block, not_list = self.parse_inner_detect_take(not_list,
-                                                                            str_id, b_type,
-                                                                            str_val, curr_block)
-                    else:
+                    if b_type not in bool_types:
                         # - 0x4 in next line b'couse of stupid func, need fix it
                         b_value, b_off = self.get_block_value(cur_p - 0x4, b_type)
-                        str_id, str_val = self.from_id_to_str(b_id, b_type, b_value, sub_units_names)
-                        curr_block, not_list = self.parse_inner_detect_take(not_list,
-                                                                            str_id, b_type,
-                                                                            str_val, curr_block)
                         # and there
                         cur_p += b_off - 0x4
+                    tree.add_param(self.name_ids[b_id], b_type, self.get_param_value(b_type, b_value, sub_units_names))
+                params_count += flat_num
                 b_size = (0, group_num)
             else:  # flat_num == 0
                 b_id, b_type = self.get_block_id_w_type(cur_p)
                 b_value, b_off = self.get_block_value(cur_p, b_type)
                 # print 'b_id, b_type, b_value = ', b_id, b_type, b_value
                 cur_p += b_off
+                child_id = tree.add_block(self.name_ids[b_id])
+                children.append(child_id)
                 if b_value != (0, 0):  # not empty group
-                    inner_block, cur_p = self.parse_inner_v3(cur_p, b_value, sub_units_names)
-                else:
-                    inner_block = []
-                str_id, skip_block = self.from_id_to_str(b_id, b_type, b_value, sub_units_names)
-                curr_block, not_list = self.parse_inner_detect_take(not_list,
-                                                                    str_id, b_type,
-                                                                    inner_block, curr_block)
+                    cur_p = self.parse_inner_v3(tree, child_id, cur_p, b_value, sub_units_names)
 
                 flat_num, group_num = b_size
                 b_size = (flat_num, group_num - 1)
             if b_size == (0, 0):
                 break
-        return curr_block, cur_p
-
-    def parse_inner_detect_take(self, is_not_list: bool, str_id, val_type, value, block) -> Tuple[Any, bool]:
-        """
-        Check if str_id not already in block as key, and change it type
-        to list if necessary(duplicated), and return block and is_not_list state
-        """
-        if self.output_type == BLK.output_type['strict_blk']:
-            block.append((str_id, val_type, value))
-        elif self.output_type == BLK.output_type['json_2']:
-            # first value, no duplicates
-            if str_id not in block:
-                block[str_id] = [value]
-            # duplicate, so add to array of values
-            else:
-                block[str_id].append(value)
-        elif is_not_list:
-            if str_id in block:  # duplicates, create list from dict
-                block = [{c[0]: c[1]} for c in block.items()]
-                block.append({str_id: value})
-                is_not_list = False
-            else:
-                block[str_id] = value
-        else:
-            block.append({str_id: value})
-        return block, is_not_list
+        tree.set_block_content(block_id, first_param, params_count, children)
+        return cur_p
 
     # return block id with type
     def get_block_id_w_type(self, offset: int) -> Tuple[int, int]:
-        block_id, block_type = struct.unpack_from('HxB', self.data, offset)
-        return block_id, block_type
-
-    def from_id_to_str(self, id: int, type: int, value, sub_units_names) -> Tuple[str, Any]:
-        item_id = self.ids_w_names[id]
-        item_type = type_list[type]
-        if item_type != 'size':
-            item_value = self.print_item(item_type, value, sub_units_names)
-            return item_id, item_value  # for json
-        else:
-            return item_id, []
+        return block_id_w_type_struct.unpack_from(self.data, offset)
+
+    def get_param_value(self, b_type: int, b_value, sub_units_names: List[bytes]):
+        """
+        Resolve value, read by `get_block_value`, to form stored in `BlkTree`: decoded string, time as number.
+        """
+        if b_type == 0x1:  # 'str'
+            return decode_string(sub_units_names[b_value])
+        elif b_type == 0xc:  # 'time'
+            return b_value[0]
+        return b_value
 
     # return value, next offset
     def get_block_value(self, id_offset: int, block_type: int) -> Tuple[Any, int]:
-        if block_type not in type_list:
+        block_value_struct = block_value_structs[block_type]
+        if block_value_struct is None:
             raise TypeError("Unknown type = {:x}, position = {:x}".format(block_type, id_offset))
-        block_type_from_list = type_list[block_type]
-        if block_type_from_list == 'str':
-            value, offset = struct.unpack_from('I', self.data, id_offset + 0x4)[0], 0x8
-        elif block_type_from_list == 'int':
-            value, offset = struct.unpack_from('i', self.data, id_offset + 0x4)[0], 0x8
-        elif block_type_from_list == 'float':
-            value, offset = struct.unpack_from('f', self.data, id_offset + 0x4)[0], 0x8
-        elif block_type_from_list == 'typex':  # reversed 'bool'
-            value, offset = struct.unpack_from('B', self.data, id_offset + 0x2)[0], 0x4
-        elif block_type_from_list == 'bool':
-            value, offset = struct.unpack_from('B', self.data, id_offset + 0x2)[0], 0x4
-        elif block_type_from_list == 'size':  # [xxyy], xx - flat size, yy - group num
-            value, offset = struct.unpack_from('HH', self.data, id_offset + 0x4), 0x8
-        elif block_type_from_list == 'vec2f':
-            value, offset = struct.unpack_from('ff', self.data, id_offset + 0x4), 0xc
-        elif block_type_from_list == 'vec3f':
-            value, offset = list(struct.unpack_from('fff', self.data, id_offset + 0x4)), 0x10
-        elif block_type_from_list == 'vec2i':
-            value, offset = struct.unpack_from('II', self.data, id_offset + 0x4), 0xc
-        elif block_type_from_list == 'time':  # unixtime
-            value, offset = struct.unpack_from('II', self.data, id_offset + 0x4), 0xc
-        elif block_type_from_list == 'vec4f':
-            value, offset = struct.unpack_from('ffff', self.data, id_offset + 0x4), 0x14
-        elif block_type_from_list == 'm4x3f':
-            ret = [self.get_block_value(id_offset, 0x5)[0],
-                   self.get_block_value(id_offset + 0xc, 0x5)[0],
-                   self.get_block_value(id_offset + 0x18, 0x5)[0],
-                   self.get_block_value(id_offset + 0x24, 0x5)[0]]
-            value, offset = ret, 0x34
-        elif block_type_from_list == 'color':  # color code, like #6120f00
-            value, offset = struct.unpack_from('I', self.data, id_offset + 0x4)[0], 0x8
-        elif block_type_from_list == 'typex7':  # what type?
-            value, offset = struct.unpack_from('I', self.data, id_offset + 0x4)[0], 0x8
-        elif block_type_from_list == 'vec3i':  # what type?
-            value, offset = struct.unpack_from('III', self.data, id_offset + 0x4), 0x10
-        return value, offset
-
-    def print_item(self, item_type: str, item_data, sub_units_names):
-        if item_type == 'str':
-            s = sub_units_names[item_data]
-            try:
-                return s.decode("utf-8")
-            except UnicodeDecodeError as e:  # russian win encoding
-                return s.decode("cp1251")
-            except Exception as e:
-                import sys
-                from traceback import print_exc
-                print_exc(file=sys.stdout)
-        elif item_type == 'float':
-            return float('%.4f' % item_data)
-        elif item_type == 'bool':
-            return True if item_data else False
-        elif item_type == 'typex':
-            return True if not item_data else False
-        elif item_type == 'color':
-            return "#{:08x}".format(item_data)
-        elif item_type in ['typex7', 'int']:
-            return item_data
-        elif item_type in ['vec4f', 'vec3f', 'vec2f']:
-            return NoIndent([float("{:e}".format(i)) for i in item_data])
-        elif item_type == 'time':
-            return item_data[0]
-        elif item_type in ['vec2i', 'vec3i']:
-            return NoIndent(list(item_data))
-        elif item_type == 'm4x3f':  # 'vec3f' in 'm4x3f'
-            return [self.print_item('vec3f', item, sub_units_names) for item in item_data]
-        else:
-            raise TypeError("Unknown type = {:x}".format(item_type))
-
-    # format output for strict blk type
-    def print_item_for_strict_blk(self, item_str_id, item_type, item_data,
-                                  indent_level: int) -> str:
-        ret = "%s%s:%s=" % ('  ' * indent_level, item_str_id, type_list_strict_blk[item_type])
-        item_type_from_list = type_list[item_type]
-        if item_type_from_list == 'str':
-            # if double quote in string: escape with single quote
-            if '"' in item_data:
-                return "%s'%s'" % (ret, item_data)
-            # else use double quote
-            # TODO what if single and double quote used?
-            else:
-                return '%s"%s"' % (ret, item_data)
-        elif item_type_from_list == 'bool' or item_type_from_list == 'typex':
-            item_val = 'yes' if bool(item_data) else 'no'
-            return ret + item_val
-        elif item_type_from_list in ['vec4f', 'vec3f', 'vec2f', 'vec2i', 'vec3i']:
-            return ret + repr(item_data)[1:-1]
-        elif item_type_from_list == 'm4x3f':
-            return '{}{}'.format(ret, str(item_data).replace('],', ']'))
-        elif item_type_from_list == 'color':
-            color_string = ', '.join([str(int(item_data[i: i + 2], 16)) for i in range(1, 9, 2)])
-            return '{}{}'.format(ret, color_string)
-        else:
-            return ret + str(item_data)
-
-    def print_strict_blk(self, s_data) -> str:
-        s_data_lines = self.print_strict_blk_inner(s_data)
-        if s_data_lines[0] == '':
-            s_data_lines.pop(0)
-        return '\n'.join(s_data_lines)
-
-    def print_strict_blk_inner(self, s_data, indent_level=0) -> List[str]:
-        lines = []
-        for line in s_data:
-            id_str_name = line[0]
-            # check if name matches allowed blk variable name, or quot it
-            # TODO: what if double quote or single and double in name?
-            if not quotless_variable_name.match(id_str_name):
-                id_str_name = '"' + id_str_name + '"'
-            if type_list[line[1]] != 'size':
-                lines.append(self.print_item_for_strict_blk(id_str_name, line[1], line[2], indent_level))
-            else:  # inner list
-                lines.append('')
-                lines.append('%s%s{' % ('  ' * indent_level, id_str_name))
-                # recursive call function and add results to list
-                lines.extend(self.print_strict_blk_inner(line[2], indent_level + 1))
-                lines.append('%s}' % ('  ' * indent_level))
-        return lines
+        value_struct, value_offset, next_offset, post_process = block_value_struct
+        value = value_struct.unpack_from(self.data, id_offset + value_offset)
+        if post_process:
+            value = post_process(value)
+        return value, next_offset
 
     def _hash_key_name(self, key: str) -> int:
         """
@@ -558,7 +517,466 @@ class BLK:
         return key_hash
 
 
-def unpack_file(filename: os.PathLike, out_type: int, is_sorted: bool):
+def read_uleb128(data, offset: int) -> Tuple[int, int]:
+    """
+    Read unsigned LEB128 number, return it and next offset
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def read_names(data, offset: int, names_count: int, names_data_size: int) -> List[str]:
+    """
+    Read names, separated by zero byte
+    """
+    names = bytes(data[offset:offset + names_data_size]).split(b'\0')[:names_count]
+    return [sys.intern(name.decode('utf-8', errors='replace')) for name in names]
+
+
+def parse_name_map(data) -> List[str]:
+    """
+    Parse shared name map: decompressed `nm` file from new vromfs, used by slim blk files.
+    """
+    names_count, cur_p = read_uleb128(data, 0)
+    names_data_size, cur_p = read_uleb128(data, cur_p)
+    return read_names(data, cur_p, names_count, names_data_size)
+
+
+class SlimBLK(BLK):
+    """
+    Decoder for blk files from new vromfs (2.7.0.58+): slim ones, which keep names in shared name map, and fat ones,
+    with own names.
+
+    Format is a set of tables: names (only in fat files), params data, params info (8 bytes per param: name id,
+    type and value or offset of value in params data) and blocks info (name id, params count, blocks count, first
+    child block id). Params are taken by blocks in order of blocks.
+    """
+    # size of values, stored in params data, others are stored in params info
+    params_data_formats = {
+        0x4: struct.Struct('<2f'), 0x5: struct.Struct('<3f'), 0x6: struct.Struct('<4f'), 0x7: struct.Struct('<2i'),
+        0x8: struct.Struct('<3i'), 0xb: struct.Struct('<12f'), 0xc: struct.Struct('<q'),
+    }
+
+    def __init__(self, data, name_map: Optional[List[str]] = None):
+        """
+        :param data: unpacked blk data, without leading packed type byte
+        :param name_map: shared name map for slim blk, parsed with `parse_name_map`, None for fat blk
+        """
+        super(SlimBLK, self).__init__(data)
+        self.name_map = name_map
+
+    def _decode(self) -> BlkTree:
+        names_count, cur_p = read_uleb128(self.data, 0)
+        if self.name_map is None:
+            names_data_size, cur_p = read_uleb128(self.data, cur_p)
+            names = read_names(self.data, cur_p, names_count, names_data_size)
+            cur_p += names_data_size
+        else:
+            names = self.name_map
+        blocks_count, cur_p = read_uleb128(self.data, cur_p)
+        params_count, cur_p = read_uleb128(self.data, cur_p)
+        params_data_size, cur_p = read_uleb128(self.data, cur_p)
+        params_data = self.data[cur_p:cur_p + params_data_size]
+        cur_p += params_data_size
+        params = self.data[cur_p:cur_p + params_count * 8]
+        cur_p += params_count * 8
+
+        tree = BlkTree(names)
+        for name_id_w_type, value in struct.iter_unpack('<II', params):
+            param_type = name_id_w_type >> 24
+            tree.add_param(name_id_w_type & 0xffffff, param_type,
+                           self.get_param_value(param_type, value, params_data, names))
+
+        # params are taken by blocks in order of blocks
+        first_param = 0
+        for i in range(blocks_count):
+            name_id, cur_p = read_uleb128(self.data, cur_p)
+            block_params_count, cur_p = read_uleb128(self.data, cur_p)
+            child_blocks_count, cur_p = read_uleb128(self.data, cur_p)
+            if child_blocks_count > 0:
+                first_block_id, cur_p = read_uleb128(self.data, cur_p)
+            else:
+                first_block_id = 0
+            # name id 0 is root
+            block_id = tree.add_block(name_id - 1 if name_id else 0)
+            tree.set_block_content(block_id, first_param, block_params_count,
+                                   range(first_block_id, first_block_id + child_blocks_count))
+            first_param += block_params_count
+        return tree
+
+    def get_param_value(self, param_type: int, value: int, params_data, names: List[str]):
+        """
+        Read param value to form stored in `BlkTree`, same as for old blk files.
+
+        :param value: value from params info: value itself, or offset in params data for long values
+        """
+        if param_type not in type_list:
+            raise TypeError("Unknown type = {:x}".format(param_type))
+        item_type = type_list[param_type]
+        if item_type == 'str':
+            # high bit: string from name map, else offset of zero terminated string in params data
+            if value & 0x80000000:
+                return names[value & 0x7fffffff]
+            end_p = params_data.find(b'\0', value)
+            return decode_string(bytes(params_data[value:end_p if end_p != -1 else len(params_data)]))
+        elif item_type == 'int':
+            return struct.unpack('<i', struct.pack('<I', value))[0]
+        elif item_type == 'float':
+            return struct.unpack('<f', struct.pack('<I', value))[0]
+        elif item_type == 'time':
+            return self.params_data_formats[param_type].unpack_from(params_data, value)[0]
+        elif item_type == 'm4x3f':
+            matrix = self.params_data_formats[param_type].unpack_from(params_data, value)
+            return [matrix[i:i + 3] for i in range(0, 12, 3)]
+        elif param_type in self.params_data_formats:
+            return self.params_data_formats[param_type].unpack_from(params_data, value)
+        else:
+            return value
+
+
+def decode_string(s: bytes) -> str:
+    try:
+        return s.decode("utf-8")
+    except UnicodeDecodeError:  # russian win encoding
+        return s.decode("cp1251")
+
+
+def vector_value(value) -> List[float]:
+    return [float("{:e}".format(i)) for i in value]
+
+
+# type byte: conversion of value from `BlkTree` to output value
+output_value_converters: Dict[int, Callable] = {
+    0x0: lambda value: [],  # 'size'
+    0x1: lambda value: value,  # 'str'
+    0x2: lambda value: value,  # 'int'
+    0x3: lambda value: float('%.4f' % value),  # 'float'
+    0x4: vector_value,  # 'vec2f'
+    0x5: vector_value,  # 'vec3f'
+    0x6: vector_value,  # 'vec4f'
+    0x7: list,  # 'vec2i'
+    0x8: list,  # 'vec3i'
+    0x9: bool,  # 'bool'
+    0xa: lambda value: "#{:08x}".format(value),  # 'color'
+    0xb: lambda value: [vector_value(row) for row in value],  # 'm4x3f', 'vec3f' in 'm4x3f'
+    0xc: lambda value: value,  # 'time'
+    0x10: lambda value: value,  # 'typex7'
+    0x89: lambda value: not value,  # 'typex'
+}
+
+# vectors are written in one line in json
+vector_types = (0x4, 0x5, 0x6, 0x7, 0x8)
+
+
+def json_scalar(value) -> str:
+    """
+    Encode scalar value same as `json.dumps(value, ensure_ascii=False)` does.
+    """
+    if isinstance(value, str):
+        return encode_basestring(value)
+    elif value is True:
+        return 'true'
+    elif value is False:
+        return 'false'
+    elif isinstance(value, int):
+        return int.__repr__(value)
+    elif value != value:
+        return 'NaN'
+    elif value == float('inf'):
+        return 'Infinity'
+    elif value == -float('inf'):
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+class BlkJsonWriter:
+    """
+    Write `BlkTree` as json in one pass, as chunks of text.
+
+    Objects and lists are indented, vectors are written in one line. Block becomes object, or list of one key
+    objects, if it has duplicated keys; for `json_2` format - object with lists of values for each key.
+    Empty block is written as empty list.
+    """
+
+    def __init__(self, tree: BlkTree, indent: Optional[int] = 2, is_json_2: bool = False, is_sorted: bool = False,
+                 chunk_size: int = OUTPUT_CHUNK_SIZE):
+        """
+        :param indent: indent of nested items, None for minified json
+        :param is_sorted: sort keys of objects
+        :param chunk_size: approximate number of written pieces in one chunk
+        """
+        self.tree = tree
+        self.indent = indent
+        self.key_separator = ': ' if indent is not None else ':'
+        self.is_json_2 = is_json_2
+        self.is_sorted = is_sorted
+        self.chunk_size = chunk_size
+        self.pieces: List[str] = []
+        self.write = self.pieces.append
+
+    def iter_chunks(self) -> Iterator[str]:
+        yield from self.write_block(0, 0)
+        if self.pieces:
+            yield self.flush()
+
+    def write_json(self, stream: TextIO):
+        for chunk in self.iter_chunks():
+            stream.write(chunk)
+
+    def flush(self) -> str:
+        chunk = ''.join(self.pieces)
+        self.pieces.clear()
+        return chunk
+
+    def newline(self, level: int) -> str:
+        if self.indent is None:
+            return ''
+        return '\n' + ' ' * (self.indent * level)
+
+    def write_container(self, brackets: str, items: List, level: int,
+                        write_item: Callable[[Any, int], Iterator[str]]) -> Iterator[str]:
+        if not items:
+            self.write(brackets)
+            return
+        self.write(brackets[0])
+        item_separator = self.newline(level + 1)
+        for i, item in enumerate(items):
+            self.write(',' + item_separator if i else item_separator)
+            yield from write_item(item, level + 1)
+        self.write(self.newline(level) + brackets[1])
+
+    def write_key_value(self, key_value: Tuple[str, Any], level: int) -> Iterator[str]:
+        key, value = key_value
+        self.write(encode_basestring(key) + self.key_separator)
+        yield from self.write_value(value, level)
+
+    def write_one_key_object(self, key_value: Tuple[str, Any], level: int) -> Iterator[str]:
+        yield from self.write_container('{}', [key_value], level, self.write_key_value)
+
+    def write_values_list(self, key_values: Tuple[str, List], level: int) -> Iterator[str]:
+        key, values = key_values
+        self.write(encode_basestring(key) + self.key_separator)
+        yield from self.write_container('[]', values, level, self.write_value)
+
+    def write_value(self, value: Tuple[bool, int], level: int) -> Iterator[str]:
+        """
+        :param value: (is_block, block id or param id)
+        """
+        is_block, item_id = value
+        if is_block:
+            yield from self.write_block(item_id, level)
+        else:
+            self.write_param(item_id, level)
+
+    def write_block(self, block_id: int, level: int) -> Iterator[str]:
+        """
+        Write block, yield chunks of written text, when enough of them collected.
+        """
+        tree = self.tree
+        if tree.is_empty(block_id):
+            self.write('[]')
+            return
+        items = [(tree.param_name(param_id), (False, param_id)) for param_id in tree.params(block_id)]
+        items.extend((tree.block_name(child_id), (True, child_id)) for child_id in tree.children(block_id))
+        if self.is_json_2:
+            values: Dict[str, List] = OrderedDict()
+            for key, value in items:
+                values.setdefault(key, []).append(value)
+            key_values = list(values.items())
+            if self.is_sorted:
+                key_values.sort(key=itemgetter(0))
+            yield from self.write_container('{}', key_values, level, self.write_values_list)
+        elif len(set(key for key, value in items)) == len(items):
+            if self.is_sorted:
+                items.sort(key=itemgetter(0))
+            yield from self.write_container('{}', items, level, self.write_key_value)
+        else:
+            # duplicates, write list of objects
+            yield from self.write_container('[]', items, level, self.write_one_key_object)
+        if len(self.pieces) >= self.chunk_size:
+            yield self.flush()
+
+    def write_param(self, param_id: int, level: int):
+        param_type = self.tree.param_types[param_id]
+        value = output_value_converters[param_type](self.tree.param_values[param_id])
+        if param_type in vector_types:
+            self.write('[{}]'.format(','.join(map(json_scalar, value))))
+        elif param_type == 0xb:  # 'm4x3f'
+            row_separator = self.newline(level + 1)
+            self.write('[{}{}]'.format(
+                ''.join(('{}[{}]'.format(',' + row_separator if i else row_separator, ','.join(map(json_scalar, row)))
+                         for i, row in enumerate(value))),
+                self.newline(level)))
+        elif param_type == 0x0:  # 'size'
+            self.write('[]')
+        else:
+            self.write(json_scalar(value))
+
+
+def strict_blk_name(name: str) -> str:
+    # check if name matches allowed blk variable name, or quot it
+    # TODO: what if double quote or single and double in name?
+    if not quotless_variable_name.match(name):
+        return '"' + name + '"'
+    return name
+
+
+def strict_blk_value(param_type: int, value) -> str:
+    value = output_value_converters[param_type](value)
+    if param_type == 0x1:  # 'str'
+        # if double quote in string: escape with single quote
+        if '"' in value:
+            return "'%s'" % value
+        # else use double quote
+        # TODO what if single and double quote used?
+        else:
+            return '"%s"' % value
+    elif param_type in bool_types:
+        return 'yes' if value else 'no'
+    elif param_type in vector_types:
+        return repr(value)[1:-1]
+    elif param_type == 0xb:  # 'm4x3f'
+        return '[{}]'.format(' '.join(repr(row) for row in value))
+    elif param_type == 0xa:  # 'color'
+        return ', '.join([str(int(value[i: i + 2], 16)) for i in range(1, 9, 2)])
+    else:
+        return str(value)
+
+
+def iter_strict_blk_lines(tree: BlkTree, block_id: int, indent_level: int = 0) -> Iterator[str]:
+    indent = '  ' * indent_level
+    for param_id in tree.params(block_id):
+        param_type = tree.param_types[param_id]
+        name = strict_blk_name(tree.param_name(param_id))
+        if param_type != 0x0:
+            yield '%s%s:%s=%s' % (indent, name, type_list_strict_blk[param_type],
+                                  strict_blk_value(param_type, tree.param_values[param_id]))
+        else:  # 'size' param is written as empty block
+            yield ''
+            yield '%s%s{' % (indent, name)
+            yield '%s}' % indent
+    for child_id in tree.children(block_id):
+        yield ''
+        yield '%s%s{' % (indent, strict_blk_name(tree.block_name(child_id)))
+        yield from iter_strict_blk_lines(tree, child_id, indent_level + 1)
+        yield '%s}' % indent
+
+
+def iter_strict_blk_chunks(tree: BlkTree, chunk_size: int = OUTPUT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Write `BlkTree` in strict blk format, as chunks of lines, separated by newline.
+    """
+    lines = iter_strict_blk_lines(tree, 0)
+    first_line = next(lines, None)
+    if first_line is None:
+        return
+    pieces = [first_line] if first_line != '' else []
+    is_started = False
+    for line in lines:
+        pieces.append(line)
+        if len(pieces) >= chunk_size:
+            yield ('\n' if is_started else '') + '\n'.join(pieces)
+            is_started = True
+            pieces.clear()
+    if pieces:
+        yield ('\n' if is_started else '') + '\n'.join(pieces)
+
+
+def sniff_blk(data: bytes) -> str:
+    """
+    Cheap guess of blk data type, by magic and first bytes: 'binary' for packed blk, 'text' for text blk,
+    'other' for anything else. Text blk is guessed by prefix only: no control chars, valid utf-8 and it consists of
+    blk statements, like `name:t="value"`, `name{` or `}`.
+    """
+    if data[:4] in (BLK.bbf_magic, BLK.bbz_magic):
+        return 'binary'
+    prefix = bytes(data[:SNIFF_SIZE])
+    if text_blk_control_chars.search(prefix):
+        return 'other'
+    try:
+        prefix.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # prefix can cut last multibyte char
+        if e.start < len(prefix) - 3:
+            return 'other'
+    # tokenize prefix by statements, checking braces
+    pos = 0
+    depth = 0
+    statements_count = 0
+    while True:
+        pos = text_blk_separators.match(prefix, pos).end()
+        match = text_blk_statement.match(prefix, pos)
+        if not match:
+            break
+        pos = match.end()
+        statements_count += 1
+        if prefix[pos - 1] == ord('{'):
+            depth += 1
+        elif prefix[pos - 1] == ord('}'):
+            depth -= 1
+            if depth < 0:
+                return 'other'
+    if not statements_count:
+        return 'other'
+    if len(prefix) == len(data):
+        # whole file checked
+        return 'text' if pos == len(prefix) and depth == 0 else 'other'
+    # only last line of prefix can be cut
+    return 'text' if b'\n' not in prefix[pos:] else 'other'
+
+
+def iter_decode_blk(binary_data: bytes, out_type: int, is_sorted: bool, validate: bool = False) -> Iterator[str]:
+    """
+    Unpack blk data, or check, that data is already text blk, and return iterator over chunks of output.
+    Data is decoded before return, so raises WrongFiletypeError, if data is not a blk, before any output.
+
+    :param validate: check text blk with full grammar parse, instead of guess by its start
+    """
+    blk = BLK(binary_data)
+    try:
+        blk.decode()
+    except NotPackedBLKError:
+        if sniff_blk(binary_data) != 'text':
+            raise WrongFiletypeError("Unknown file type")
+        try:
+            # maybe it already in blk format
+            text_data = binary_data.decode('utf-8')
+        except UnicodeDecodeError:
+            raise WrongFiletypeError("Unknown file type")
+        if validate:
+            # lark is imported only for validation, it's slow to import
+            from lark import LarkError
+            try:
+                get_blk_parser().parse(text_data)
+            except LarkError:
+                raise WrongFiletypeError("Unknown file type")
+        return iter((text_data,))
+    return blk.iter_unpack(out_type, is_sorted)
+
+
+def decode_blk(binary_data: bytes, out_type: int, is_sorted: bool, validate: bool = False) -> str:
+    """
+    Unpack blk data, or check, that data is already text blk, and return it as is.
+    Raises WrongFiletypeError, if data is not a blk.
+    """
+    return ''.join(iter_decode_blk(binary_data, out_type, is_sorted, validate))
+
+
+def unpack_file(filename: os.PathLike, out_type: int, is_sorted: bool, cache: Optional[BlkCache] = None,
+                validate: bool = False):
+    """
+    Unpack blk file to blkx file near it.
+
+    :param cache: if set, take decoded file from cache, or put it there after decoding
+    :param validate: check text blk files with full grammar parse
+    """
     with open(filename, 'rb') as f:
         binary_data = f.read()
 
@@ -570,48 +988,84 @@ def unpack_file(filename: os.PathLike, out_type: int, is_sorted: bool):
         with open(out_filename, 'wb') as f:
             pass
         return
-    blk = BLK(binary_data)
-    # TODO: fix this exception block, its ugly
-    decoded_data = None
+    # text blk files aren't taken from cache with validate, they could be put there without grammar check
+    if cache and validate and sniff_blk(binary_data) != 'binary':
+        cache = None
+    if cache:
+        cache_key = cache.key(binary_data, out_type, is_sorted)
+        if cache.get(cache_key, out_filename):
+            return
+    chunks = None
     try:
-        decoded_data = blk.unpack(out_type, is_sorted)
-    except NotPackedBLKError as e:
-        global blk_parser
-        if not blk_parser:
-            grammar_path = 'blk.lark'
-            blk_parser = Lark(open(os.path.join(get_tool_path(), grammar_path)).read(), parser='lalr')
-        try:
-            # reread file as text and parse it, maybe it already in blk format
-            with open(filename, 'r', newline='') as f:
-                text_data = f.read()
-            blk_parser.parse(text_data)
-            decoded_data = text_data
-        except LarkError as e2:
-            raise WrongFiletypeError("Unknown file type")
+        chunks = iter_decode_blk(binary_data, out_type, is_sorted, validate)
     except WrongFiletypeError as e:
         print('    ', e)
     except TypeError as e:
         print('    ', e)
-    if decoded_data:
+    if chunks:
+        # output is written while formatting, without building whole text
         with open(out_filename, 'w', newline='', encoding='utf-8') as f:
-            f.write(decoded_data)
+            for chunk in chunks:
+                f.write(chunk)
+        if cache:
+            cache.put(cache_key, out_filename)
 
 
-def unpack_dir(dirname: os.PathLike, out_type: int, is_sorted: bool):
-    """
-    Unpack all *.blk files in `dirname` with `out_type` format.
-    """
+def iter_blk_files(dirname: os.PathLike) -> Iterator[str]:
+    # sorted walk, so files are unpacked and reported in same order every time
     for root, dirs, files in os.walk(dirname):
-        for filename in files:
+        dirs.sort()
+        for filename in sorted(files):
             subname = os.path.join(root, filename)
             if os.path.isfile(subname) and os.path.splitext(subname)[1] == '.blk':
-                print(subname)
-                try:
-                    unpack_file(subname, out_type, is_sorted)
-                except Exception as e:
-                    import sys
-                    from traceback import print_exc
-                    print_exc(file=sys.stdout)
+                yield subname
+
+
+def unpack_file_logged(task: Tuple[str, int, bool, Optional[BlkCache], bool]) -> Tuple[str, str]:
+    """
+    Unpack file, return its name and output: messages and errors are collected per file, to print them in order,
+    when files are unpacked in worker processes.
+    """
+    filename, out_type, is_sorted, cache, validate = task
+    log = io.StringIO()
+    with redirect_stdout(log):
+        try:
+            unpack_file(filename, out_type, is_sorted, cache, validate)
+        except Exception:
+            print_exc(file=log)
+    return filename, log.getvalue()
+
+
+def init_worker(validate: bool):
+    # build parser for text blk files once per worker, not per file
+    if validate:
+        get_blk_parser()
+
+
+def unpack_dir(dirname: os.PathLike, out_type: int, is_sorted: bool, jobs: int = 1, cache: Optional[BlkCache] = None,
+               validate: bool = False):
+    """
+    Unpack all *.blk files in `dirname` with `out_type` format.
+
+    :param jobs: number of worker processes, files are sent to them in chunks, results are printed in order of files
+    :param cache: cache of decoded files, shared by workers
+    :param validate: check text blk files with full grammar parse
+    """
+    tasks = [(filename, out_type, is_sorted, cache, validate) for filename in iter_blk_files(dirname)]
+    if jobs > 1 and len(tasks) > 1:
+        jobs = min(jobs, len(tasks))
+        # few chunks per worker, to balance files of different sizes
+        chunksize = max(1, min(64, len(tasks) // (jobs * 4)))
+        import multiprocessing
+        with multiprocessing.Pool(jobs, initializer=init_worker, initargs=(validate,)) as pool:
+            for filename, log in pool.imap(unpack_file_logged, tasks, chunksize):
+                print(filename)
+                print(log, end='')
+    else:
+        for task in tasks:
+            print(task[0])
+            filename, log = unpack_file_logged(task)
+            print(log, end='')
 
 
 @click.command()
@@ -619,7 +1073,14 @@ def unpack_dir(dirname: os.PathLike, out_type: int, is_sorted: bool):
 @click.option('--format', 'out_format', type=click.Choice(['json', 'json_min', 'strict_blk', 'json_2'],
     case_sensitive=False), default='json', show_default=True)
 @click.option('--sort', 'is_sorted', is_flag=True, default=False)
-def main(path: os.PathLike, out_format: str, is_sorted: bool):
+@click.option('--jobs', 'jobs', type=click.IntRange(min=1), default=os.cpu_count() or 1, show_default=True)
+@click.option('--no_cache', '--no-cache', 'no_cache', is_flag=True, default=False)
+@click.option('--cache_dir', '--cache-dir', 'cache_dir', type=click.Path(file_okay=False), default=None)
+@click.option('--cache_size', '--cache-size', 'cache_size', type=click.IntRange(min=0),
+              default=DEFAULT_MAX_SIZE // (1024 * 1024), show_default=True)
+@click.option('--validate', 'validate', is_flag=True, default=False)
+def main(path: os.PathLike, out_format: str, is_sorted: bool, jobs: int, no_cache: bool,
+         cache_dir: Optional[os.PathLike], cache_size: int, validate: bool):
     """
     blk_unpack: Unpacks blk files to human readable version
 
@@ -632,6 +1093,17 @@ def main(path: os.PathLike, out_format: str, is_sorted: bool):
 
     sort: sort keys in json output, should be more easy to see diff
 
+    jobs: number of processes, used to unpack folder, by default number of CPUs
+
+    no_cache: don't use cache of decoded files. By default decoded files are cached by hash of blk file, output format
+    and sort option, and taken from cache next time, instead of decoding.
+
+    cache_dir: folder of cache, by default in user cache folder, like ~/.cache/wt-tools/blk
+
+    cache_size: max size of cache in MB, least recently used files are removed
+
+    validate: check not packed (text) blk files with full blk grammar, by default they are checked only by start of file
+
     examples: `blk_unpack some.blk` will unpack to `some.blkx` using json format (default). If you want to get file to
     use it in game, use 'blk_unpack --format=strict_blk some.blk'. You can also unpack a folder with blk files:
     `blk_unpack some_folder`.
@@ -647,11 +1119,21 @@ def main(path: os.PathLike, out_format: str, is_sorted: bool):
     else:
         out_type = BLK.output_type['json']
 
+    cache = None
+    if not no_cache:
+        cache = BlkCache(cache_dir or get_default_cache_dir(), cache_size * 1024 * 1024)
+
     if os.path.isfile(path):
-        unpack_file(path, out_type, is_sorted)
+        unpack_file(path, out_type, is_sorted, cache, validate)
     else:
-        unpack_dir(path, out_type, is_sorted)
+        unpack_dir(path, out_type, is_sorted, jobs, cache, validate)
+
+    if cache:
+        cache.evict()
 
 
 if __name__ == '__main__':
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
     main()
@@ -1,16 +1,14 @@
-import ctypes
+import argparse
 import os.path
 import struct
-import sys
-import zlib
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 
-import pylzma
-import zstandard
-
-from formats.common import get_tool_path
-from formats.ddsx_parser import ddsx
+from formats.ddsx_codecs import DDSXError, get_codec, iter_codec_stats
+from formats.ddsx_header import DDSXHeader, FLG_REV_MIP_ORDER
 
 ddsx_types = [b'DXT1', b'DXT5']
+# size of 4x4 pixels block
+dxt_block_sizes = {b'DXT1': 8, b'DXT5': 16}
 
 dds_header = [
     0x44, 0x44, 0x53, 0x20, 0x7C, 0x00, 0x00, 0x00,
@@ -31,152 +29,208 @@ dds_header = [
     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00
 ]
 
-compression_type = {0x0: "not_packed", 0x20: "zstd", 0x40: "lzma", 0x60: "oodle", 0x80: "zlib"}
+# max size of read and unpacked textures in memory, when unpacking folder with few threads
+DEFAULT_IN_FLIGHT_SIZE = 256 * 1024 * 1024
+
 
-dll_name = 'oo2core_6_win64.dll'
-dll_real_path = os.path.join(get_tool_path(), dll_name)
-oodle_dll = None
-if not os.path.exists(dll_real_path):
-    print(
-        "Can't unpack oodle compressed textures, until {} not placed to wt-tools directory"
-        .format(dll_name))
-else:
-    oodle_dll = ctypes.cdll.LoadLibrary(dll_real_path)
+def get_mip_size(width: int, height: int, texture_format: bytes) -> int:
+    # https://docs.microsoft.com/en-us/windows/win32/direct3ddds/dds-file-layout-for-textures
+    return max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * dxt_block_sizes[texture_format]
 
 
-def unpack(data: bytes):
+def unpack_parts(data: bytes, body: Optional[memoryview] = None) -> List[Union[bytes, bytearray, memoryview]]:
     """
-    Unpack data from ddsx and returns it. If data have wrong header, prints error
-    and return None. Return unpacked dds data, ready for saving.
+    Unpack data from ddsx and return parts of dds file: header and mip levels, from biggest to smallest.
+    Mip levels are views of unpacked data, so they are copied only once, when joined or written to file.
+    Raises DDSXError, if texture can't be unpacked.
 
     :param data: ddsx data
+    :param body: packed texture, if it's stored apart from ddsx header, like in dxp archives, then `data` is header
     """
-    parsed_data = ddsx.parse(data)
-    texture_format = parsed_data.header.d3dFormat
+    header = DDSXHeader.parse(data)
+    texture_format = header.d3dFormat
     if texture_format not in ddsx_types:
-        print("Texture format {} unsupported yet".format(texture_format))
-        return
-
-    dds_compression_type = struct.unpack_from('B', data, 0xb)[0]
-
-    dds_data = ctypes.create_string_buffer(0x80)
-    struct.pack_into('128B', dds_data, 0, *dds_header)
-    struct.pack_into('I', dds_data, 0xc, parsed_data.header.h)
-    struct.pack_into('I', dds_data, 0x10, parsed_data.header.w)
-    struct.pack_into('I', dds_data, 0x14, parsed_data.header.memSz)
-    struct.pack_into('B', dds_data, 0x1c, parsed_data.header.levels)
-    struct.pack_into('4s', dds_data, 0x54, parsed_data.header.d3dFormat)
-
-    dds_packed = compression_type.get(dds_compression_type, "")
-    if dds_packed == "not_packed":
-        d_data = data[0x20:]
-    elif dds_packed == "lzma":
-        d_data = pylzma.decompress(data[0x20:], maxlength=parsed_data.header.memSz)
-    elif dds_packed == "zlib":
-        d_data = zlib.decompress(data[0x20:])
-    elif dds_packed == "oodle":
-        '''
-        private static extern long OodleLZ_Decompress(byte[] buffer, long bufferSize, byte[] result,
-            long outputBufferSize, int a, int b, int c, long d, long e,
-            long f, long g, long h, long i, int ThreadModule);
-        '''
-        if oodle_dll:
-            decompressed_data = ctypes.create_string_buffer(parsed_data.header.memSz)
-            res = oodle_dll.OodleLZ_Decompress(data[0x20:], parsed_data.header.packedSz,
-                                               decompressed_data,
-                                               parsed_data.header.memSz, 0, 0, 0, 0, 0, 0, 0, 0, 0,
-                                               3)
-            if res == 0:
-                print("Error unpacking oodle compressed texture")
-                return
-            d_data = decompressed_data.raw
-        else:
-            print("unsupported compression type: {}".format(dds_packed))
-    elif dds_packed == "zstd":
-        dctx = zstandard.ZstdDecompressor()
-        d_data = dctx.decompress(data[0x20:], max_output_size=parsed_data.header.memSz)
-        if d_data == 0:
-            print("Error unpacking zstd compressed texture")
-            return
+        raise DDSXError("Texture format {} unsupported yet".format(texture_format))
+
+    dds_data = bytearray(dds_header)
+    struct.pack_into('I', dds_data, 0xc, header.h)
+    struct.pack_into('I', dds_data, 0x10, header.w)
+    struct.pack_into('I', dds_data, 0x14, header.memSz)
+    struct.pack_into('B', dds_data, 0x1c, header.levels)
+    struct.pack_into('4s', dds_data, 0x54, header.d3dFormat)
+
+    codec = get_codec(header.compression)
+    if body is None:
+        d_data = codec.decode(data, memoryview(data)[DDSXHeader.size:], header.memSz, header.packedSz)
     else:
-        print("Unknown compression type: {}".format(dds_compression_type))
-        return
+        d_data = codec.decode(body, body, header.memSz, header.packedSz)
 
     if not d_data:
-        print("unpacked data empty somehow")
+        raise DDSXError("unpacked data empty somehow")
+
+    d_view = memoryview(d_data)
+    if not header.has_flags(FLG_REV_MIP_ORDER):
+        return [dds_data, d_view]
+
+    # Reverse MIPMAP order (from smallest -> biggest to biggest -> smallest), only dxt formats get there
+    pos = 0
+    images = []
+    for level in range(header.levels - 1, -1, -1):
+        width = header.w // (2 ** level)
+        height = header.h // (2 ** level)
+        size = get_mip_size(width, height, texture_format)
+        images.append(d_view[pos:pos + size])
+        pos += size
+    images.reverse()
+    return [dds_data] + images
+
+
+def unpack(data: bytes) -> bytes:
+    """
+    Unpack data from ddsx and return unpacked dds data, ready for saving.
+    Raises DDSXError, if texture can't be unpacked.
+
+    :param data: ddsx data
+    """
+    return b''.join(unpack_parts(data))
+
+
+def write_parts(f: BinaryIO, parts: List[Union[bytes, bytearray, memoryview]]):
+    """
+    Write parts of file, without joining them: by `os.writev`, where it's supported, or one by one.
+    """
+    if not hasattr(os, 'writev'):
+        for part in parts:
+            f.write(part)
         return
+    f.flush()
+    views = [memoryview(part) for part in parts]
+    while views:
+        written = os.writev(f.fileno(), views)
+        # writev can write not all parts at once
+        while views and written >= len(views[0]):
+            written -= len(views.pop(0))
+        if written:
+            views[0] = views[0][written:]
+
+
+def unpacked_size(data: bytes) -> int:
+    """
+    Size of unpacked texture, from ddsx header, without parsing it.
+    """
+    return struct.unpack_from('<I', data, 0x18)[0] if len(data) >= 0x20 else 0
 
-    if parsed_data.header.flags.FLG_REV_MIP_ORDER:
-        # Reverse MIPMAP order (from smallest -> biggest to biggest -> smallest)
-        if texture_format in [b'DXT1', b'DXT5']:
-            # https://docs.microsoft.com/en-us/windows/win32/direct3ddds/dds-file-layout-for-textures
-            def get_dxt1_size(t_width, t_height, dxt_version):
-                dxt_size = max(1, (t_width + 3) // 4) * max(1, (t_height + 3) // 4)
-                if dxt_version == b'DXT1':
-                    return dxt_size * 8
-                elif dxt_version == b'DXT5':
-                    return dxt_size * 16
-                else:
-                    print("unknown dxt version: {}", dxt_version)
-                    return
-
-            pos = 0
-            images = []
-            for level in range(parsed_data.header.levels - 1, -1, -1):
-                width = parsed_data.header.w // (2 ** level)
-                height = parsed_data.header.h // (2 ** level)
-                size = get_dxt1_size(width, height, texture_format)
-                images.append(d_data[pos:pos + size])
-                pos += size
-
-            d_data = bytearray()
-            for image in reversed(images):
-                d_data.extend(image)
-
-        elif parsed_data.header.levels > 1:
-            # left unpacked data as is
-            print("Dunno how to re-order mipmaps for format {}".format(texture_format))
-
-    return dds_data.raw + d_data
-
-
-def unpack_file(filename):
-    # TODO: eliminate copy&paste with blk_unpack
-    with open(filename, 'rb') as f:
-        data = f.read()
+
+def write_dds(out_filename: os.PathLike, data: bytes, body: Optional[memoryview] = None):
+    """
+    Unpack ddsx data and write it to dds file `out_filename`.
+
+    :param body: packed texture, if it's stored apart from ddsx header `data`
+    """
     if len(data) == 0:
-        print("empty file")
-        return
-    out_file = unpack(data)
-    if out_file:
-        with open(filename[:-1], 'wb') as f:
-            f.write(out_file)
+        raise DDSXError("empty file")
+    parts = unpack_parts(data, body)
+    with open(out_filename, 'wb') as f:
+        write_parts(f, parts)
 
 
-def unpack_dir(dirname):
+def write_unpacked(filename: os.PathLike, data: bytes):
     """
-    Unpack all *.ddsx files in `dirname`
+    Unpack ddsx data, read from `filename`, and write dds file near it.
     """
+    write_dds(filename[:-1], data)
+
+
+def unpack_file(filename: os.PathLike):
+    # TODO: eliminate copy&paste with blk_unpack
+    with open(filename, 'rb') as f:
+        data = f.read()
+    write_unpacked(filename, data)
+
+
+def iter_ddsx_files(dirname: os.PathLike) -> Iterator[str]:
+    # sorted walk, so files are unpacked in same order every time
     for root, dirs, files in os.walk(dirname):
-        for filename in files:
+        dirs.sort()
+        for filename in sorted(files):
             subname = os.path.join(root, filename)
             if os.path.isfile(subname) and os.path.splitext(subname)[1] == '.ddsx':
-                print("\n" + subname)
-                unpack_file(subname)
+                yield subname
+
+
+def unpack_dir(dirname: os.PathLike, jobs: int = 1,
+               max_in_flight_size: int = DEFAULT_IN_FLIGHT_SIZE) -> Tuple[int, List[Tuple[str, str]]]:
+    """
+    Unpack all *.ddsx files in `dirname`, return number of unpacked files and list of failed files with errors.
+
+    Files are read by main thread, and unpacked and written by pool of `jobs` threads: zlib, zstd and oodle release
+    GIL while decompressing. New file isn't read, while read and unpacked sizes of files in flight are bigger than
+    `max_in_flight_size`, so few big textures don't take all memory.
+    """
+    from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+    errors: List[Tuple[str, str]] = []
+    unpacked_count = 0
+
+    def collect(filename: str, future: Future):
+        nonlocal unpacked_count
+        try:
+            future.result()
+        except Exception as e:
+            errors.append((filename, str(e) or type(e).__name__))
+        else:
+            unpacked_count += 1
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        in_flight: Dict[Future, Tuple[str, int]] = {}
+        in_flight_size = 0
+        for filename in iter_ddsx_files(dirname):
+            try:
+                with open(filename, 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                errors.append((filename, str(e)))
+                continue
+            size = len(data) + unpacked_size(data)
+            while in_flight and (in_flight_size + size > max_in_flight_size or len(in_flight) >= jobs * 2):
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    done_filename, done_size = in_flight.pop(future)
+                    in_flight_size -= done_size
+                    collect(done_filename, future)
+            in_flight[executor.submit(write_unpacked, filename, data)] = (filename, size)
+            in_flight_size += size
+            # data is kept by future now
+            del data
+        for future, (filename, size) in in_flight.items():
+            collect(filename, future)
+    errors.sort()
+    return unpacked_count, errors
 
 
 def main():
-    if len(sys.argv) != 2:
-        print('usage: ddsx_unpack.py PATH\n'
-              'where PATH - file or folder')
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="unpack ddsx textures to dds")
+    parser.add_argument('path', help="ddsx file or folder")
+    parser.add_argument('--jobs', dest='jobs', type=int, default=os.cpu_count() or 1,
+                        help="number of threads, used to unpack folder, by default number of CPUs")
+    parse_result = parser.parse_args()
 
-    filename = sys.argv[1]
+    filename = parse_result.path
 
     if os.path.isfile(filename):
-        unpack_file(filename)
+        try:
+            unpack_file(filename)
+        except (DDSXError, ValueError) as e:
+            print(e)
     else:
-        unpack_dir(filename)
+        unpacked_count, errors = unpack_dir(filename, max(1, parse_result.jobs))
+        print("unpacked {} files".format(unpacked_count))
+        if errors:
+            print("failed to unpack {} files:".format(len(errors)))
+            for error_filename, error in errors:
+                print("{}: {}".format(error_filename, error))
+        for stats in iter_codec_stats():
+            print(stats)
 
 
 if __name__ == '__main__':
@@ -1,12 +1,11 @@
-import struct, sys, os, errno
+import argparse
+import errno
+import os
+from typing import Dict, Iterable, List, Tuple
 
-
-dxp2_magic = 'DxP2'
-file_names_block_offset = 0x48
-second_block_offset_from = 0x10  # + 0x10
-dds_block_offset_from = 0x20  # + 0x10
-block_3_offset_from = 0x30  # + 0x10
-block_4_offset_from = 0xc  # + 0x10
+from ddsx_unpack import DEFAULT_IN_FLIGHT_SIZE, unpacked_size, write_dds
+from formats.ddsx_codecs import iter_codec_stats
+from formats.dxp_archive import DxpArchive
 
 
 def mkdir_p(path):
@@ -21,74 +20,97 @@ def mkdir_p(path):
             raise
 
 
-def main():
-    if len(sys.argv) != 2:
-        print('usage: dxp_unpack.py file')
-        sys.exit(1)
-
-    filename = sys.argv[1]
-    dist_dir = filename + '_u/'
+def write_texture(dist_dir: str, name: str, ddsx_header: memoryview, body: memoryview, decode: bool):
+    """
+    Write texture as ddsx file, or unpack it in memory and write dds file only, with `decode`.
+    """
+    if decode:
+        write_dds(dist_dir + name + '.dds', ddsx_header, body)
+    else:
+        with open(dist_dir + name + '.ddsx', 'wb') as f:
+            f.write(ddsx_header)
+            f.write(body)
+
+
+def write_textures(dist_dir: str, textures: Iterable[Tuple[str, memoryview, memoryview]], decode: bool = False,
+                   jobs: int = 1, max_in_flight_size: int = DEFAULT_IN_FLIGHT_SIZE) -> Tuple[int, List[Tuple[str, str]]]:
+    """
+    Write textures (name, ddsx header, body) to `dist_dir`, return number of written textures and list of failed
+    textures with errors.
+
+    With `decode`, textures are unpacked by pool of `jobs` threads, so unpacked ddsx files aren't written to disk and
+    read back by ddsx_unpack. Like in `ddsx_unpack.unpack_dir`, new texture isn't sent to pool, while unpacked sizes
+    of textures in flight are bigger than `max_in_flight_size`.
+    """
+    from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+    if not decode:
+        jobs = 1
+    errors: List[Tuple[str, str]] = []
+    written_count = 0
+
+    def collect(name: str, future: Future):
+        nonlocal written_count
+        try:
+            future.result()
+        except Exception as e:
+            errors.append((name, str(e) or type(e).__name__))
+        else:
+            written_count += 1
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        in_flight: Dict[Future, Tuple[str, int]] = {}
+        in_flight_size = 0
+        for name, ddsx_header, body in textures:
+            size = unpacked_size(ddsx_header) if decode else len(body)
+            while in_flight and (in_flight_size + size > max_in_flight_size or len(in_flight) >= jobs * 2):
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    done_name, done_size = in_flight.pop(future)
+                    in_flight_size -= done_size
+                    collect(done_name, future)
+            in_flight[executor.submit(write_texture, dist_dir, name, ddsx_header, body, decode)] = (name, size)
+            in_flight_size += size
+        for future, (name, size) in in_flight.items():
+            collect(name, future)
+    errors.sort()
+    return written_count, errors
 
-    with open(filename, 'rb') as f:
-        data = f.read()
 
-    if len(data) == 0:
-        print("empty file")
-        exit(1)
+def main():
+    parser = argparse.ArgumentParser(description="unpack textures from dxp archive")
+    parser.add_argument('filename', help="dxp file")
+    parser.add_argument('--decode', action='store_true', default=False,
+                        help="unpack textures to dds files, without writing ddsx files")
+    parser.add_argument('--jobs', dest='jobs', type=int, default=os.cpu_count() or 1,
+                        help="number of threads, used to unpack textures with --decode, by default number of CPUs")
+    parse_result = parser.parse_args()
+
+    filename = parse_result.filename
+    dist_dir = filename + '_u/'
 
-    if struct.unpack_from('4s', data, 0)[0].decode('utf-8') != dxp2_magic:
-        print("wrong dxp type")
+    try:
+        archive = DxpArchive(filename)
+    except ValueError as e:
+        print(e)
         exit(1)
 
-    total_files = struct.unpack_from('H', data, 0x8)[0]
-    print("total files:", total_files)
-    cur_p = file_names_block_offset
-    # TODO: fix path, like in vromfs_unpacker with abs path
-    file_names = []
-    for i in range(total_files):
-        old_cur_p = cur_p
-        while data[cur_p] != 0x0:
-            cur_p += 1
-        file_names.append(data[old_cur_p: cur_p].decode('utf-8'))
-        cur_p += 1
-
-    for i in file_names:
-        print(i)
-
-    cur_p = struct.unpack_from('I', data, second_block_offset_from)[0] + 0x10
-    offsets_block_1 = []
-    for i in range(total_files):
-        offsets_block_1.append(struct.unpack_from('I', data, cur_p)[0])
-        cur_p += 0x8
-
-    '''
-    from end:
-        0x4: unpacked size
-        0x4: packed size
-    '''
-    cur_p = struct.unpack_from('I', data, dds_block_offset_from)[0] + 0x10
-    dds_block = []
-    for i in range(total_files):
-        dds_block.append(data[cur_p: cur_p + 0x20])
-        cur_p += 0x20
-
-    '''
-        0xc - offset
-        0x10 - size
-    '''
-    cur_p = struct.unpack_from('I', data, block_3_offset_from)[0] + 0x10
-    block_3 = []
-    for i in range(total_files):
-        offset = struct.unpack_from('I', data, cur_p + 0xc)[0]
-        size = struct.unpack_from('I', data, cur_p + 0x10)[0]
-        block_3.append((offset, size))
-        cur_p += 0x18
-
-    mkdir_p(dist_dir)
-    for i, (off, size) in enumerate(block_3):
-        with open(dist_dir + file_names[i].split('*')[0] + '.ddsx', 'wb') as f:
-            f.write(dds_block[i])
-            f.write(data[off: off + size])
+    with archive:
+        print("total files:", len(archive))
+        # TODO: fix path, like in vromfs_unpacker with abs path
+        for name in archive.filenames:
+            print(name)
+
+        mkdir_p(dist_dir)
+        written_count, errors = write_textures(dist_dir, archive.iter_entries(), parse_result.decode,
+                                               max(1, parse_result.jobs))
+    if errors:
+        print("failed to write {} of {} textures:".format(len(errors), written_count + len(errors)))
+        for name, error in errors:
+            print("{}: {}".format(name, error))
+    if parse_result.decode:
+        for stats in iter_codec_stats():
+            print(stats)
 
 
 if __name__ == '__main__':
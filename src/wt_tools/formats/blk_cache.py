@@ -0,0 +1,108 @@
+import hashlib
+import os
+import shutil
+from typing import List, Tuple
+
+from formats.common import get_cache_dir
+
+'''
+On-disk cache of decoded blk files, keyed by hash of blk data, output format and sort flag.
+Most of blk files are the same between game versions, so they can be copied from cache instead of decoding.
+'''
+
+# bump it, when blk_unpack output changes, so old cached files aren't used
+CACHE_VERSION = 1
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+
+def get_default_cache_dir() -> str:
+    return os.path.join(get_cache_dir(), 'blk')
+
+
+class BlkCache:
+    """
+    Flat-file store of decoded blk files: `<cache_dir>/<2 first chars of key>/<key>.blkx`.
+
+    Used files are touched, so `evict` removes least recently used ones, when cache gets bigger than `max_size`.
+    Files are written to temp file and renamed, so few processes can share one cache.
+    """
+
+    def __init__(self, cache_dir: os.PathLike, max_size: int = DEFAULT_MAX_SIZE):
+        """
+        :param max_size: max size of cache in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    @staticmethod
+    def key(data: bytes, out_type: int, is_sorted: bool) -> str:
+        return '{}-{}-{:d}-{}'.format(hashlib.md5(data).hexdigest(), out_type, is_sorted, CACHE_VERSION)
+
+    def path_of(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + '.blkx')
+
+    def get(self, key: str, out_filename: os.PathLike) -> bool:
+        """
+        Copy cached file to `out_filename`, return False, if there is no such file in cache.
+        """
+        path = self.path_of(key)
+        try:
+            shutil.copyfile(path, out_filename)
+        except OSError:
+            # not in cache, or cache can't be read
+            return False
+        try:
+            os.utime(path)
+        except OSError:
+            # evicted by another process just now
+            pass
+        return True
+
+    def put(self, key: str, filename: os.PathLike) -> bool:
+        """
+        Store copy of decoded file in cache, return False, if it can't be written, like to read-only or full disk:
+        file is just not cached then.
+        """
+        path = self.path_of(key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(filename, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def evict(self) -> int:
+        """
+        Remove least recently used files, until cache fits in `max_size`, return number of removed files.
+        Files, which can't be removed, are skipped.
+        """
+        files: List[Tuple[float, int, str]] = []
+        total_size = 0
+        # not readable dirs are skipped by walk
+        for root, dirs, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+        removed = 0
+        for mtime, size, path in sorted(files):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            removed += 1
+        return removed
@@ -0,0 +1,165 @@
+import re
+from typing import Dict, Iterator, List, Match
+
+'''
+Hand-written minifier of text blk, faster alternative to lark parser with `blk.lark` grammar.
+
+Text is read statement by statement with regexes: `name:type=value`, `name{` or `}`, separated by newlines, `;` and
+comments. Output is yielded by chunks while reading, so whole tree is never built in memory.
+'''
+
+SIGNED_NUMBER = r'[+\-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+\-]?\d+)?'
+NUMBERS_LIST = r'{0}(?:\s*,\s*{0})*'.format(SIGNED_NUMBER)
+
+blk_statement = re.compile(r'''
+    (?P<name>[a-zA-Z0-9_\-.][a-zA-Z0-9_\-./]*|"[a-zA-Z0-9_\- !?.\[\](),+'@:/*&]+")\s*
+    (?:
+        :\s*(?P<type>i64|p2|p3|p4|ip2|ip3|b|c|m|t|i|r)\s*=[ \t\f]*
+        (?:
+            (?P<string>"[^"]*"|'[^']*')
+            |(?P<value>yes|no|true|false
+                |\[\s*(?:\[\s*(?:{0})?\s*\]\s*)*\]
+                |(?:{0})?)
+        )
+        |(?P<open>\{{)
+    )
+    |(?P<close>\}})'''.format(NUMBERS_LIST), re.VERBOSE)
+blk_separators = re.compile(r'(?:[ \t\f\r\n;]|//[^\n]*)*')
+whitespace = re.compile(r'\s+')
+
+
+class BlkSyntaxError(ValueError):
+    pass
+
+
+def syntax_error(blk_data: str, pos: int, message: str) -> BlkSyntaxError:
+    line = blk_data.count('\n', 0, pos) + 1
+    column = pos - blk_data.rfind('\n', 0, pos)
+    return BlkSyntaxError('{}, at line {}, column {}'.format(message, line, column))
+
+
+def is_blank(blk_data: str) -> bool:
+    """
+    Text has no statements: only whitespace, `;` and comments.
+    """
+    return blk_separators.fullmatch(blk_data) is not None
+
+
+class BlkMinifier:
+    """
+    State of minifier between statements: opened objects and separators, which are needed before next output.
+
+    Objects are written, when their first value is written, so with `strip_empty_objects` opened, but not written
+    objects are kept in stack, and dropped, if they are closed without values.
+    """
+
+    def __init__(self, minify_options: Dict[str, bool]):
+        self.strip_empty_objects = minify_options.get('strip_empty_objects', False)
+        self.strip_comment_objects = minify_options.get('strip_comment_objects', False)
+        self.strip_disabled_objects = minify_options.get('strip_disabled_objects', False)
+        # opened objects, not written yet
+        self.pending: List[str] = []
+        self.depth = 0
+        # depth inside stripped object, nothing is written while it > 0
+        self.skip_depth = 0
+        # values on top level are separated by `;`, but objects aren't
+        self.need_separator = False
+
+    def is_stripped(self, name: str) -> bool:
+        # disabled objects starts with __ in mission editor:  __unitRespawn{
+        return (self.strip_comment_objects and name == 'comment') or \
+            (self.strip_disabled_objects and name.startswith('__'))
+
+    def open_object(self, name: str) -> str:
+        """
+        Return output for `name{`, empty, if object isn't written yet.
+        """
+        out = ''
+        if not self.depth and self.need_separator:
+            out = ';'
+            self.need_separator = False
+        self.depth += 1
+        if self.skip_depth:
+            self.skip_depth += 1
+        elif self.is_stripped(name):
+            self.skip_depth = 1
+        elif self.strip_empty_objects:
+            self.pending.append(name + '{')
+        else:
+            out += name + '{'
+        return out
+
+    def close_object(self) -> str:
+        """
+        Return output for `}`, depth is checked by caller.
+        """
+        self.depth -= 1
+        if self.skip_depth:
+            self.skip_depth -= 1
+        elif self.pending:
+            # empty object
+            self.pending.pop()
+        else:
+            return '}'
+        return ''
+
+    def value(self, match: Match) -> str:
+        """
+        Return output for `name:type=value` statement.
+        """
+        if self.skip_depth:
+            return ''
+        value = match.group('string')
+        if value is None:
+            value = whitespace.sub('', match.group('value'))
+        statement = '{}:{}={}'.format(match.group('name'), match.group('type'), value)
+        if not self.depth:
+            out = ';' + statement if self.need_separator else statement
+            self.need_separator = True
+            return out
+        if self.pending:
+            statement = ''.join(self.pending) + statement
+            self.pending.clear()
+        return statement + ';'
+
+
+def iter_minify(blk_data: str, minify_options: Dict[str, bool]) -> Iterator[str]:
+    """
+    Minify text blk, same way as lark parser with blk_transformer, and yield output by chunks. Unlike lark parser,
+    keeps `;` after value, which follows object, and allows empty statements in objects.
+    Raises BlkSyntaxError on wrong statement or not matched braces.
+    """
+    minifier = BlkMinifier(minify_options)
+    # last statement is value, it must be ended by newline or `;`
+    need_end = False
+    pos = 0
+    size = len(blk_data)
+    while True:
+        separators_end = blk_separators.match(blk_data, pos).end()
+        if need_end and separators_end > pos:
+            separators = blk_data[pos:separators_end]
+            need_end = '\n' not in separators and ';' not in separators
+        pos = separators_end
+        if pos == size:
+            break
+        match = blk_statement.match(blk_data, pos)
+        if not match:
+            raise syntax_error(blk_data, pos, 'Unexpected text')
+        if need_end:
+            raise syntax_error(blk_data, pos, 'Expected newline or `;`')
+
+        if match.group('close'):
+            if not minifier.depth:
+                raise syntax_error(blk_data, pos, 'Unexpected `}`')
+            out = minifier.close_object()
+        elif match.group('open'):
+            out = minifier.open_object(match.group('name'))
+        else:
+            need_end = True
+            out = minifier.value(match)
+        if out:
+            yield out
+        pos = match.end()
+
+    if minifier.depth:
+        raise syntax_error(blk_data, pos, 'Expected `}`')
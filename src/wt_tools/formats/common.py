@@ -1,63 +1,18 @@
 import os.path
 import sys
-import zlib
-
-from construct import Construct, Struct, Tell, Computed, Seek, this, FlagsEnum, Container, BitwisableString
-from lark import Transformer, tree, lexer
-
-
-# used for unpacking zlib block and return in context
-class ZlibContext(Construct):
-    def __init__(self):
-        super(ZlibContext, self).__init__()
-
-    def _parse(self, stream, ctx, path):
-        ctx.decompressed_data, ctx.size_of_unused_data = self._zlib_decompress(stream.getvalue()[ctx.start_offset:])
-
-    def _zlib_decompress(self, data):
-        zdo = zlib.decompressobj()
-        decompressed_data = zdo.decompress(data)
-        size_of_unused_data = len(zdo.unused_data)
-        return decompressed_data, size_of_unused_data
-
-
-class FlagsEnumCumulative(FlagsEnum):
-    def __init__(self, subcon, *merge, **flags):
-        super(FlagsEnumCumulative, self).__init__(subcon)
-        for enum in merge:
-            for enumentry in enum:
-                flags[enumentry.name] = enumentry.value
-        self.flags = flags
-        # keep reverse sorted flag values, so we can substract from our flag
-        self.flags_reverse_sorted = sorted(self.flags.items(), key=lambda x: x[1], reverse=True)
-
-    def _decode(self, obj, context, path):
-        obj2 = Container()
-        obj2._flagsenum = True
-        assert isinstance(obj, int)
-        leftover = obj
-        for name, value in self.flags_reverse_sorted:
-            if leftover > value:
-                leftover -= value
-                obj2[BitwisableString(name)] = True
-            else:
-                obj2[BitwisableString(name)] = False
-        return obj2
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from lark import Lark, Transformer
 
-# only one 'real' field is `decompressed_body`, other only for changing offset
-zlib_stream = "zlib_stream" / Struct(
-    "start_offset" / Tell,
-    ZlibContext(),
-    "unused_size" / Computed(this.size_of_unused_data),
-    "global_file_size" / Seek(0, 2),
-    "decompressed_body" / Computed(this.decompressed_data),
-    "end_offset" / Computed(this.global_file_size - this.unused_size),
-    Seek(this.end_offset)
-)
+# parsers for text blk, by minify options, built once per process
+_blk_parsers: Dict[Optional[Tuple], 'Lark'] = {}
 
 
 def blk_transformer(strip_options):
+    # lark is imported only when text blk is parsed, it's slow to import
+    from lark import Transformer, tree, lexer
+
     class BLKTransformer(Transformer):
         def var_value(self, s):
             if type(s[0]) == str:
@@ -157,3 +112,74 @@ def get_tool_path() -> os.PathLike:
         # unfrozen
         tool_path = os.path.dirname(os.path.realpath(__file__))
     return tool_path
+
+
+def get_cache_dir() -> str:
+    """
+    Folder for cached data of tools, in user cache folder.
+    """
+    if os.name == 'nt':
+        base_dir = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    else:
+        base_dir = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(base_dir, 'wt-tools')
+
+
+def load_lark_parser(grammar_name: str, transformer: Optional['Transformer'] = None, **options) -> 'Lark':
+    """
+    Build LALR parser for grammar from tool folder. Parse tables are saved to cache folder, keyed by hash of grammar,
+    options and lark version, so next time they are only loaded.
+
+    :param transformer: transformer, applied while parsing; it's not saved with tables, so can be any
+    """
+    import hashlib
+    import pickle
+
+    import lark
+    from lark import Lark
+    from lark.grammar import Rule
+    from lark.lexer import TerminalDef
+
+    with open(os.path.join(get_tool_path(), grammar_name)) as f:
+        grammar = f.read()
+    options['parser'] = 'lalr'
+    options_hash = hashlib.sha1((grammar + repr(sorted(options.items())) + lark.__version__).encode()).hexdigest()
+    tables_path = os.path.join(get_cache_dir(), 'lark', '{}-{}.pickle'.format(os.path.splitext(grammar_name)[0],
+                                                                              options_hash[:16]))
+    # same format as Lark.save, but Lark.load can't set transformer
+    namespace = {'Rule': Rule, 'TerminalDef': TerminalDef}
+    try:
+        with open(tables_path, 'rb') as f:
+            tables = pickle.load(f)
+        return Lark.deserialize(tables['data'], namespace, tables['memo'], transformer=transformer)
+    except Exception:
+        # no saved tables yet, or they are broken
+        pass
+
+    data, memo = Lark(grammar, **options).memo_serialize([TerminalDef, Rule])
+    try:
+        os.makedirs(os.path.dirname(tables_path), exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(tables_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'data': data, 'memo': memo}, f)
+        os.replace(tmp_path, tables_path)
+    except OSError:
+        # read only cache folder, build tables every time
+        pass
+    return Lark.deserialize(data, namespace, memo, transformer=transformer)
+
+
+def get_blk_parser(minify_options: Optional[Dict[str, bool]] = None) -> 'Lark':
+    """
+    Parser for text blk, built once per process.
+
+    :param minify_options: if set, return parser of blk_minify, which transforms blk to minified string with this
+        options, else return parser for blk validation
+    """
+    key = tuple(sorted(minify_options.items())) if minify_options is not None else None
+    if key not in _blk_parsers:
+        if minify_options is None:
+            _blk_parsers[key] = load_lark_parser('blk.lark')
+        else:
+            _blk_parsers[key] = load_lark_parser('blk.lark', blk_transformer(minify_options), keep_all_tokens=True)
+    return _blk_parsers[key]
@@ -0,0 +1,59 @@
+import zlib
+
+from construct import Construct, Struct, Tell, Computed, Seek, this, FlagsEnum, Container, BitwisableString
+
+'''
+Common construct types of formats. They are kept apart from formats.common, so tools, which don't use construct
+parsers, don't import it.
+'''
+
+
+# used for unpacking zlib block and return in context
+class ZlibContext(Construct):
+    def __init__(self):
+        super(ZlibContext, self).__init__()
+
+    def _parse(self, stream, ctx, path):
+        ctx.decompressed_data, ctx.size_of_unused_data = self._zlib_decompress(stream.getvalue()[ctx.start_offset:])
+
+    def _zlib_decompress(self, data):
+        zdo = zlib.decompressobj()
+        decompressed_data = zdo.decompress(data)
+        size_of_unused_data = len(zdo.unused_data)
+        return decompressed_data, size_of_unused_data
+
+
+class FlagsEnumCumulative(FlagsEnum):
+    def __init__(self, subcon, *merge, **flags):
+        super(FlagsEnumCumulative, self).__init__(subcon)
+        for enum in merge:
+            for enumentry in enum:
+                flags[enumentry.name] = enumentry.value
+        self.flags = flags
+        # keep reverse sorted flag values, so we can substract from our flag
+        self.flags_reverse_sorted = sorted(self.flags.items(), key=lambda x: x[1], reverse=True)
+
+    def _decode(self, obj, context, path):
+        obj2 = Container()
+        obj2._flagsenum = True
+        assert isinstance(obj, int)
+        leftover = obj
+        for name, value in self.flags_reverse_sorted:
+            if leftover > value:
+                leftover -= value
+                obj2[BitwisableString(name)] = True
+            else:
+                obj2[BitwisableString(name)] = False
+        return obj2
+
+
+# only one 'real' field is `decompressed_body`, other only for changing offset
+zlib_stream = "zlib_stream" / Struct(
+    "start_offset" / Tell,
+    ZlibContext(),
+    "unused_size" / Computed(this.size_of_unused_data),
+    "global_file_size" / Seek(0, 2),
+    "decompressed_body" / Computed(this.decompressed_data),
+    "end_offset" / Computed(this.global_file_size - this.unused_size),
+    Seek(this.end_offset)
+)
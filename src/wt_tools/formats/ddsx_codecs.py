@@ -0,0 +1,197 @@
+import ctypes
+import os.path
+import sys
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Union
+
+from formats.common import get_tool_path
+
+'''
+Decompressors of ddsx texture body, registered by compression type: top 3 bits of ddsx flags, FLG_COMPR_MASK.
+Other decompressors, like open source oodle one, can be added with `register_codec`.
+Libraries of decompressors are imported or loaded on first use, so tools start fast.
+'''
+
+# env variable with path to oodle library, used before default names
+OODLE_LIB_ENV = 'WT_TOOLS_OODLE_LIB'
+OODLE_LIB_NAMES = ['oo2core_6_win64.dll'] if os.name == 'nt' else ['liboo2corelinux64.so', 'liboo2corelinux64.so.9']
+
+COMPRESSION_MASK = 0xe0
+
+DecompressedData = Union[bytes, bytearray, memoryview]
+
+
+class DDSXError(RuntimeError):
+    pass
+
+
+class Codec:
+    """
+    Decompressor of ddsx body, which counts decompressed textures, sizes and time, to report throughput.
+    Can be used from few threads at once.
+    """
+    name = ''
+
+    def __init__(self):
+        self.count = 0
+        self.packed_size = 0
+        self.unpacked_size = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        return True
+
+    def decompress(self, data: bytes, body: memoryview, mem_size: int, packed_size: int) -> DecompressedData:
+        """
+        :param data: whole ddsx data, `body` is view of it after header, or `body` itself, if it's stored apart from
+            header, like in dxp archives
+        """
+        raise NotImplementedError
+
+    def decode(self, data: bytes, body: memoryview, mem_size: int, packed_size: int) -> DecompressedData:
+        start = time.perf_counter()
+        d_data = self.decompress(data, body, mem_size, packed_size)
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.count += 1
+            self.packed_size += len(body)
+            self.unpacked_size += len(d_data)
+            self.seconds += seconds
+        return d_data
+
+    def stats(self) -> str:
+        mb = 1024 * 1024
+        return "{}: {} textures, {:.1f} MB to {:.1f} MB, {:.1f} MB/s".format(
+            self.name, self.count, self.packed_size / mb, self.unpacked_size / mb,
+            self.unpacked_size / mb / self.seconds if self.seconds else 0.0)
+
+
+class NotPackedCodec(Codec):
+    name = 'not_packed'
+
+    def decompress(self, data: bytes, body: memoryview, mem_size: int, packed_size: int) -> DecompressedData:
+        return body
+
+
+class ZstdCodec(Codec):
+    name = 'zstd'
+
+    def decompress(self, data: bytes, body: memoryview, mem_size: int, packed_size: int) -> DecompressedData:
+        import zstandard
+        dctx = zstandard.ZstdDecompressor()
+        d_data = dctx.decompress(body, max_output_size=mem_size)
+        if d_data == 0:
+            raise DDSXError("Error unpacking zstd compressed texture")
+        return d_data
+
+
+class LzmaCodec(Codec):
+    name = 'lzma'
+
+    def decompress(self, data: bytes, body: memoryview, mem_size: int, packed_size: int) -> DecompressedData:
+        import pylzma
+        # pylzma takes only bytes
+        return pylzma.decompress(bytes(body), maxlength=mem_size)
+
+
+class ZlibCodec(Codec):
+    name = 'zlib'
+
+    def decompress(self, data: bytes, body: memoryview, mem_size: int, packed_size: int) -> DecompressedData:
+        # output buffer of right size from start, so it isn't grown by copies
+        return zlib.decompress(body, zlib.MAX_WBITS, mem_size or zlib.DEF_BUF_SIZE)
+
+
+class OodleCodec(Codec):
+    """
+    Oodle decompressor from shared library: `oo2core_6_win64.dll` on Windows, `liboo2corelinux64.so` on Linux, placed
+    to wt-tools directory, or any library with same `OodleLZ_Decompress` function, set by WT_TOOLS_OODLE_LIB env
+    variable. Library is loaded on first use.
+    """
+    name = 'oodle'
+
+    def __init__(self, lib_paths: Optional[List[str]] = None):
+        super().__init__()
+        self.lib_paths = lib_paths
+        self._lib = None
+        self._loaded = False
+
+    def get_lib_paths(self) -> List[str]:
+        if self.lib_paths is not None:
+            return self.lib_paths
+        paths = [os.environ[OODLE_LIB_ENV]] if os.environ.get(OODLE_LIB_ENV) else []
+        for lib_dir in (get_tool_path(), os.path.dirname(os.path.realpath(sys.argv[0]))):
+            paths.extend(os.path.join(lib_dir, lib_name) for lib_name in OODLE_LIB_NAMES)
+        return paths
+
+    def load(self) -> Optional[ctypes.CDLL]:
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                for path in self.get_lib_paths():
+                    if os.path.exists(path):
+                        self._lib = ctypes.CDLL(path)
+                        self._lib.OodleLZ_Decompress.restype = ctypes.c_ssize_t
+                        break
+        return self._lib
+
+    def is_available(self) -> bool:
+        return self.load() is not None
+
+    def decompress(self, data: bytes, body: memoryview, mem_size: int, packed_size: int) -> DecompressedData:
+        '''
+        private static extern long OodleLZ_Decompress(byte[] buffer, long bufferSize, byte[] result,
+            long outputBufferSize, int a, int b, int c, long d, long e,
+            long f, long g, long h, long i, int ThreadModule);
+        '''
+        lib = self.load()
+        if not lib:
+            raise DDSXError("unsupported compression type: oodle, place {} to wt-tools directory, or set path to it "
+                            "in {}".format(' or '.join(OODLE_LIB_NAMES), OODLE_LIB_ENV))
+        decompressed_data = bytearray(mem_size)
+        if isinstance(data, bytes):
+            # pointer to body inside of data
+            body_pointer = ctypes.c_void_p(ctypes.cast(data, ctypes.c_void_p).value + len(data) - len(body))
+        else:
+            body_pointer = bytes(body)
+        res = lib.OodleLZ_Decompress(body_pointer, ctypes.c_ssize_t(packed_size),
+                                     (ctypes.c_char * mem_size).from_buffer(decompressed_data),
+                                     ctypes.c_ssize_t(mem_size), 0, 0, 0, 0, 0, 0, 0, 0, 0,
+                                     3)
+        if res == 0:
+            raise DDSXError("Error unpacking oodle compressed texture")
+        return decompressed_data
+
+
+codecs: Dict[int, Codec] = {}
+
+
+def register_codec(compression_type: int, codec: Codec):
+    """
+    Set decompressor for compression type, like 0x60 for oodle, replacing previous one.
+    """
+    codecs[compression_type & COMPRESSION_MASK] = codec
+
+
+def get_codec(compression_type: int) -> Codec:
+    codec = codecs.get(compression_type & COMPRESSION_MASK)
+    if codec is None:
+        raise DDSXError("Unknown compression type: {}".format(compression_type))
+    return codec
+
+
+def iter_codec_stats() -> Iterator[str]:
+    # only used codecs
+    for compression_type, codec in sorted(codecs.items()):
+        if codec.count:
+            yield codec.stats()
+
+
+register_codec(0x0, NotPackedCodec())
+register_codec(0x20, ZstdCodec())
+register_codec(0x40, LzmaCodec())
+register_codec(0x60, OodleCodec())
+register_codec(0x80, ZlibCodec())
@@ -0,0 +1,93 @@
+import struct
+
+'''
+Fast decoder of ddsx header, without construct: same fields, as `ddsx_header` in `ddsx_parser.py`, which is kept as
+reference parser. Flags are plain int, tested by masks below.
+'''
+
+FLG_7ZIP = 0x40000000
+FLG_ADDRU_MASK = 0xf
+FLG_ADDRV_MASK = 0xf0
+FLG_ARRTEX = 0x200000
+FLG_COMPR_MASK = 0xe0000000
+FLG_CONTIGUOUS_MIP = 0x100
+FLG_CUBTEX = 0x800
+FLG_GAMMA_EQ_1 = 0x8000
+FLG_GENMIP_BOX = 0x2000
+FLG_GENMIP_KAIZER = 0x4000
+FLG_GLES3_TC_FMT = 0x100000
+FLG_HASBORDER = 0x400
+FLG_HOLD_SYSMEM_COPY = 0x10000
+FLG_HQ_PART = 0x80000
+FLG_NEED_PAIRED_BASETEX = 0x20000
+FLG_NONPACKED = 0x200
+FLG_OODLE = 0x60000000
+FLG_REV_MIP_ORDER = 0x40000
+FLG_VOLTEX = 0x1000
+FLG_ZLIB = 0x80000000
+FLG_ZSTD = 0x20000000
+
+DDSX_LABEL = b'DDSx'
+
+# label, d3dFormat, flags, w, h, levels, hqPartLevels, depth, bitsPerPixel, qmip nibbles, memSz, packedSz
+ddsx_header_struct = struct.Struct('<4s4sIHHBBHHHII')
+
+
+class DDSXHeader:
+    __slots__ = ('d3dFormat', 'flags', 'w', 'h', 'levels', 'hqPartLevels', 'depth', 'bitsPerPixel', 'qmip',
+                 'memSz', 'packedSz')
+
+    size = ddsx_header_struct.size
+
+    def __init__(self, d3dFormat: bytes, flags: int, w: int, h: int, levels: int, hqPartLevels: int, depth: int,
+                 bitsPerPixel: int, qmip: int, memSz: int, packedSz: int):
+        self.d3dFormat = d3dFormat
+        self.flags = flags
+        self.w = w
+        self.h = h
+        self.levels = levels
+        self.hqPartLevels = hqPartLevels
+        self.depth = depth
+        self.bitsPerPixel = bitsPerPixel
+        self.qmip = qmip
+        self.memSz = memSz
+        self.packedSz = packedSz
+
+    @classmethod
+    def parse(cls, data: bytes) -> 'DDSXHeader':
+        """
+        Decode header from start of ddsx data, raises ValueError, if it's not a ddsx.
+        """
+        if len(data) < cls.size:
+            raise ValueError("Not a ddsx file, size: {}".format(len(data)))
+        label, *fields = ddsx_header_struct.unpack_from(data, 0)
+        if label != DDSX_LABEL:
+            raise ValueError("Not a ddsx file, label: {}".format(label))
+        return cls(*fields)
+
+    def has_flags(self, mask: int) -> bool:
+        return self.flags & mask == mask
+
+    @property
+    def compression(self) -> int:
+        """
+        Compression type, like 0x60 for oodle: top 3 bits of flags, moved to low byte.
+        """
+        return (self.flags & FLG_COMPR_MASK) >> 24
+
+    # quality mip nibbles, in order of bit fields
+    @property
+    def lQmip(self) -> int:
+        return (self.qmip >> 4) & 0xf
+
+    @property
+    def mQmip(self) -> int:
+        return self.qmip & 0xf
+
+    @property
+    def dxtShift(self) -> int:
+        return (self.qmip >> 12) & 0xf
+
+    @property
+    def uQmip(self) -> int:
+        return (self.qmip >> 8) & 0xf
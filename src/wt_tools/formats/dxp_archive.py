@@ -0,0 +1,120 @@
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, List, Tuple
+
+
+'''
+Lazy reader for dxp texture archives: parses only header and tables, textures are returned as memoryview slices of
+mmapped file: ddsx header of texture and its body, which together make ddsx file.
+
+Layout:
+    0x0: magic `DxP2`, 0x8: number of textures,
+    0x10, 0x20, 0x30: offsets (minus 0x10) of first block (8 bytes per texture), ddsx headers block (0x20 bytes per
+        texture) and third block (0x18 bytes per texture, offset and size of texture body at 0xc and 0x10),
+    0x48: texture names, each ends with zero byte, like `name*suffix`.
+'''
+
+DXP2_MAGIC = b'DxP2'
+DXP_HEADER = struct.Struct('<4s4xH2xII12xI12xI')
+FILE_NAMES_BLOCK_OFFSET = 0x48
+# offsets of blocks are stored from 0x10
+BLOCK_OFFSET_BASE = 0x10
+DDSX_HEADER_SIZE = 0x20
+BLOCK_3_RECORD = struct.Struct('<12xII4x')
+
+
+class DxpArchive:
+    """
+    Random access to textures of dxp archive by name, name is part of filename before `*`.
+
+    Views, returned by `get` and `iter_entries`, are valid until archive is closed.
+    """
+
+    def __init__(self, filename: os.PathLike):
+        self._file = open(filename, 'rb')
+        try:
+            if os.fstat(self._file.fileno()).st_size == 0:
+                raise ValueError("empty file")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise
+        self._data = memoryview(self._mm)
+        try:
+            self._parse_tables()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.files_count
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._index
+
+    def close(self):
+        self._data.release()
+        try:
+            self._mm.close()
+        except BufferError:
+            # someone still holds views, mmap will be closed with them
+            pass
+        self._file.close()
+
+    def _parse_tables(self):
+        if len(self._data) < DXP_HEADER.size:
+            raise ValueError("Not a dxp file, size: {}".format(len(self._data)))
+        magic, self.files_count, _, block_1_offset, ddsx_headers_offset, block_3_offset = \
+            DXP_HEADER.unpack_from(self._data, 0)
+        if magic != DXP2_MAGIC:
+            raise ValueError("wrong dxp type, magic: {}".format(magic))
+        self._ddsx_headers_offset = ddsx_headers_offset + BLOCK_OFFSET_BASE
+        block_3_offset += BLOCK_OFFSET_BASE
+
+        # names are stored one by one from fixed offset, till first of blocks, so split whole names block at once
+        names_end = min([offset + BLOCK_OFFSET_BASE for offset in (block_1_offset, ddsx_headers_offset, block_3_offset)
+                         if offset + BLOCK_OFFSET_BASE > FILE_NAMES_BLOCK_OFFSET] + [len(self._data)])
+        names = self._mm[FILE_NAMES_BLOCK_OFFSET:names_end].split(b'\0', self.files_count)
+        # last part is rest of block after last name
+        if len(names) != self.files_count + 1:
+            raise ValueError("Wrong file names block: {} names, expected {}".format(len(names) - 1, self.files_count))
+        del names[-1]
+        self.filenames: List[str] = [name.decode('utf-8') for name in names]
+        self._names: List[str] = [filename.split('*')[0] for filename in self.filenames]
+
+        self._records: List[Tuple[int, int]] = list(BLOCK_3_RECORD.iter_unpack(
+            self._data[block_3_offset:block_3_offset + self.files_count * BLOCK_3_RECORD.size]))
+        if len(self._records) != self.files_count:
+            raise ValueError("Wrong textures block: {} records, expected {}".format(len(self._records),
+                                                                                    self.files_count))
+        self._index: Dict[str, int] = {}
+        for i, name in enumerate(self._names):
+            self._index.setdefault(name, i)
+
+    def names(self) -> List[str]:
+        return self._names
+
+    def get_by_index(self, i: int) -> Tuple[memoryview, memoryview]:
+        header_offset = self._ddsx_headers_offset + i * DDSX_HEADER_SIZE
+        offset, size = self._records[i]
+        return self._data[header_offset:header_offset + DDSX_HEADER_SIZE], self._data[offset:offset + size]
+
+    def get(self, name: str) -> Tuple[memoryview, memoryview]:
+        """
+        Return ddsx header and body of texture.
+
+        :param name: texture name, without `*` suffix of filename
+        """
+        return self.get_by_index(self._index[name])
+
+    def iter_entries(self) -> Iterator[Tuple[str, memoryview, memoryview]]:
+        for i, name in enumerate(self._names):
+            header, body = self.get_by_index(i)
+            yield name, header, body
@@ -0,0 +1,287 @@
+import bisect
+import mmap
+import os
+import re
+import struct
+import tempfile
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Set, Tuple
+
+
+'''
+Lazy reader for vromfs archives: parses only header, filename table and file data table,
+file bodies are returned as memoryview slices of mmapped file (or of decompressed body for packed archives).
+Layout is the same as in `vromfs_parser.py`, which is kept as reference parser.
+'''
+
+VROMFS_HEADER = struct.Struct('<4s4sII')
+VROMFS_EXT_HEADER = struct.Struct('<HHI')
+NOT_PACKED_STREAM_HEADER = struct.Struct('<II8xI')
+FILE_DATA_RECORD = struct.Struct('<II8x')
+
+# version 2.7.0.58+
+NEW_VERSION = 34013242
+
+# size of packed body chunks, fed to decompressor at once
+STREAM_CHUNK_SIZE = 1 << 20
+
+OBFS_KEY_HEAD = (0xAA55AA55, 0xF00FF00F, 0xAA55AA55, 0x12481248)
+OBFS_KEY_TAIL = (0x12481248, 0xAA55AA55, 0xF00FF00F, 0xAA55AA55)
+
+
+GLOB_SPECIAL_CHARS = re.compile(r'[*?\[]')
+
+
+def normalise_path(path: str) -> str:
+    """
+    Normalise path for matching: case as in os.path.normcase, `/` as separator, without leading slashes
+    """
+    return os.path.normcase(path).replace('\\', '/').lstrip('/')
+
+
+def glob_to_regex(glob: str) -> Pattern:
+    """
+    Translate glob to regex: `*`, `?` don't match `/`, `**` matches anything, `**/` - any number of dirs.
+    """
+    res = []
+    i = 0
+    while i < len(glob):
+        c = glob[i]
+        if glob.startswith('**/', i):
+            res.append('(?:.*/)?')
+            i += 3
+            continue
+        elif glob.startswith('**', i):
+            res.append('.*')
+            i += 2
+            continue
+        elif c == '*':
+            res.append('[^/]*')
+        elif c == '?':
+            res.append('[^/]')
+        elif c == '[' and ']' in glob[i + 2:]:
+            end = glob.index(']', i + 2)
+            chars = glob[i + 1:end]
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            res.append('[{}]'.format(chars.replace('\\', '\\\\')))
+            i = end + 1
+            continue
+        else:
+            res.append(re.escape(c))
+        i += 1
+    return re.compile(''.join(res))
+
+
+def _deobfuscate(data, key) -> bytes:
+    return struct.pack("<4L", *[x ^ y for (x, y) in zip(struct.unpack("<4L", data), key)])
+
+
+class VromfsArchive:
+    """
+    Random access to vromfs files by internal path.
+
+    Views, returned by `get` and `get_by_index`, are valid until archive is closed.
+    """
+
+    def __init__(self, filename: os.PathLike):
+        self._file = open(filename, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise
+        self._data = memoryview(self._mm)
+        self._raw = None
+        self._body_file = None
+        self._body: Optional[memoryview] = None
+        try:
+            self._parse_header()
+            self._parse_body()
+            self._parse_tables()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.files_count
+
+    def __contains__(self, path: str) -> bool:
+        return path.lstrip('/\\') in self._index
+
+    def close(self):
+        if self._body is not None:
+            self._body.release()
+            self._body = None
+        self._data.release()
+        for mm in (self._raw, self._mm):
+            if isinstance(mm, mmap.mmap):
+                try:
+                    mm.close()
+                except BufferError:
+                    # someone still holds views, mmap will be closed with them
+                    pass
+        self._raw = None
+        if self._body_file is not None:
+            self._body_file.close()
+        self._file.close()
+
+    def _parse_header(self):
+        magic, platform, self.original_size, packed = VROMFS_HEADER.unpack_from(self._data, 0)
+        if magic not in (b'VRFs', b'VRFx'):
+            raise ValueError("Not a vromfs file, magic: {}".format(magic))
+        self.magic = magic
+        self.platform = platform
+        self.packed_size = packed & 0xffffff
+        vromfs_type = packed >> 24
+        if vromfs_type == 0xc0:
+            self.packed_type = 'zstd_packed'
+        elif vromfs_type == 0x80 and self.packed_size == 0:
+            self.packed_type = 'not_packed'
+        elif vromfs_type == 0x80:
+            self.packed_type = 'zlib_packed'
+        else:
+            raise ValueError("Unknown vromfs type: {:#x}".format(vromfs_type))
+        self.body_offset = VROMFS_HEADER.size
+        self.version = None
+        if magic == b'VRFx':
+            _, _, self.version = VROMFS_EXT_HEADER.unpack_from(self._data, self.body_offset)
+            self.body_offset += VROMFS_EXT_HEADER.size
+        self.is_new_version = self.version is not None and self.version >= NEW_VERSION
+
+    def _parse_body(self):
+        # `_raw` is mmap or decompressed body, `_body` - view of it, from body start
+        if self.packed_type == 'not_packed':
+            self._raw = self._mm
+            self._body_base = self.body_offset
+        elif self.packed_type == 'zlib_packed':
+            zdo = zlib.decompressobj()
+            self._raw = zdo.decompress(self._data[self.body_offset:])
+            self._body_base = 0
+        else:
+            self._raw = self._zstd_decompress_body()
+            self._body_base = 0
+        self._body = memoryview(self._raw)[self._body_base:]
+
+    def _zstd_decompress_body(self) -> mmap.mmap:
+        """
+        Stream packed body through zstd decompressor: only head and tail are de-obfuscated copies, middle part
+        is fed by views of mmapped file. Decompressed body goes to temp file, which is mmapped then.
+        """
+        packed = self._data[self.body_offset:self.body_offset + self.packed_size]
+        if self.packed_size < 16:
+            parts = [packed]
+        elif self.packed_size < 32:
+            parts = [_deobfuscate(packed[:16], OBFS_KEY_HEAD), packed[16:]]
+        else:
+            tail_offset = 16 + (self.packed_size - 32) // 4 * 4
+            parts = [_deobfuscate(packed[:16], OBFS_KEY_HEAD), packed[16:tail_offset],
+                     _deobfuscate(packed[tail_offset:tail_offset + 16], OBFS_KEY_TAIL), packed[tail_offset + 16:]]
+
+        import zstandard
+        dobj = zstandard.ZstdDecompressor().decompressobj()
+        self._body_file = tempfile.TemporaryFile()
+        for part in parts:
+            for chunk_offset in range(0, len(part), STREAM_CHUNK_SIZE):
+                self._body_file.write(dobj.decompress(part[chunk_offset:chunk_offset + STREAM_CHUNK_SIZE]))
+        packed.release()
+        if self._body_file.tell() > self.original_size:
+            raise ValueError("Decompressed body bigger than expected: {} > {}".format(self._body_file.tell(),
+                                                                                      self.original_size))
+        self._body_file.flush()
+        return mmap.mmap(self._body_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _parse_tables(self):
+        body = self._body
+        filename_table_offset, self.files_count, filedata_table_offset = \
+            NOT_PACKED_STREAM_HEADER.unpack_from(body, 0)
+
+        # filename table is offsets table (files_count * 8 bytes) of names, which stored one by one,
+        # so split whole names block at once, from first name to end of last one
+        name_offsets = [offset for (offset,) in struct.iter_unpack(
+            '<Q', body[filename_table_offset:filename_table_offset + self.files_count * 8])]
+        if name_offsets:
+            names_end = self._raw.find(b'\0', self._body_base + name_offsets[-1]) - self._body_base
+            names = bytes(body[name_offsets[0]:names_end]).split(b'\0')
+            if len(names) != self.files_count:
+                raise ValueError("Wrong filename table: {} names, expected {}".format(len(names), self.files_count))
+        else:
+            names = []
+        # name map stored with strange name
+        self.filenames: List[str] = [(b'nm' if name == b'\xff?nm' else name).decode('utf-8') for name in names]
+
+        self._records: List[Tuple[int, int]] = list(FILE_DATA_RECORD.iter_unpack(
+            body[filedata_table_offset:filedata_table_offset + self.files_count * FILE_DATA_RECORD.size]))
+
+        # clean leading slashes, there was a bug in 1.99.1.70 with "/version" file path
+        self.paths: List[str] = [name.lstrip('/\\') for name in self.filenames]
+        self._index: Dict[str, int] = {path: i for i, path in enumerate(self.paths)}
+        self._normalised_index: Optional[Dict[str, int]] = None
+        self._sorted_paths: Optional[List[Tuple[str, int]]] = None
+
+    def _build_select_index(self):
+        self._normalised_index = {}
+        for i, path in enumerate(self.paths):
+            self._normalised_index.setdefault(normalise_path(path), i)
+        self._sorted_paths = sorted(self._normalised_index.items())
+
+    def select(self, selectors: Iterable[str] = (), regexes: Iterable[str] = ()) -> List[int]:
+        """
+        Return sorted indexes of files, matched by any of selectors or regexes.
+
+        :param selectors: exact paths or globs, like `gamedata/units/**/*.blk`: `*` and `?` don't match `/`,
+            `**/` matches any number of dirs
+        :param regexes: regular expressions, should match whole path
+        """
+        if self._normalised_index is None:
+            self._build_select_index()
+        matched: Set[int] = set()
+        for selector in selectors:
+            selector = normalise_path(selector)
+            prefix_len = len(GLOB_SPECIAL_CHARS.split(selector, 1)[0])
+            # exact path, lookup in hash index
+            if prefix_len == len(selector):
+                if selector in self._normalised_index:
+                    matched.add(self._normalised_index[selector])
+                continue
+            # glob, check only paths with same literal prefix
+            prefix = selector[:prefix_len]
+            pattern = glob_to_regex(selector)
+            pos = bisect.bisect_left(self._sorted_paths, (prefix,))
+            while pos < len(self._sorted_paths) and self._sorted_paths[pos][0].startswith(prefix):
+                path, i = self._sorted_paths[pos]
+                if pattern.fullmatch(path):
+                    matched.add(i)
+                pos += 1
+        for regex in regexes:
+            pattern = re.compile(regex)
+            matched.update(i for path, i in self._sorted_paths if pattern.fullmatch(path))
+        return sorted(matched)
+
+    def index_of(self, path: str) -> int:
+        return self._index[path.lstrip('/\\')]
+
+    def size_of(self, i: int) -> int:
+        return self._records[i][1]
+
+    def get_by_index(self, i: int) -> memoryview:
+        offset, size = self._records[i]
+        return self._body[offset:offset + size]
+
+    def get(self, path: str) -> memoryview:
+        """
+        Return file data as memoryview.
+
+        :param path: internal file path, like `gamedata/units/tankmodels/fr_b1_ter.blk`
+        """
+        return self.get_by_index(self.index_of(path))
+
+    def iter_entries(self) -> Iterator[Tuple[str, memoryview]]:
+        for i, path in enumerate(self.paths):
+            yield path, self.get_by_index(i)
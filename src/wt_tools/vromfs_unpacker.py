@@ -1,13 +1,19 @@
 import errno
 import json
 import os
+import threading
 from hashlib import md5
-from typing import Optional
+from typing import Optional, Union, List, Set, Dict, Any, Tuple, Iterable, TYPE_CHECKING
 
 import click
-import zstandard
 
-from formats.vromfs_parser import vromfs_file
+from blk_unpack import BLK, SlimBLK, WrongFiletypeError, decode_blk, parse_name_map
+from formats.vromfs_archive import VromfsArchive
+
+if TYPE_CHECKING:
+    import zstandard
+
+MANIFEST_VERSION = 1
 
 
 def mkdir_p(path):
@@ -22,116 +28,311 @@ def mkdir_p(path):
             raise
 
 
-def unpack(filename: os.PathLike, dist_dir: os.PathLike, file_list_path: Optional[os.PathLike] = None):
+def unpack_entry(archive: VromfsArchive, i: int, dctx) -> Union[bytes, memoryview]:
+    """
+    Returns unpacked data of `i` file in archive
+
+    :param archive: opened vromfs archive
+    :param i: file index in archive
+    :param dctx: zstd decompressor for new vromfs versions
+    """
+    data = archive.get_by_index(i)
+    # older blk versions
+    if not archive.is_new_version:
+        return data
+    is_dict_here = archive.filenames[0].endswith('.dict')
+    is_namemap_here = archive.filenames[archive.files_count - 1] == 'nm'
+    if is_dict_here and i == 0:
+        return data
+    # last file `?nm` - name map
+    # skip first 40 bytes, unpack, and few start bytes in unpacked namemap is unknown
+    elif is_namemap_here and i == archive.files_count - 1:
+        return dctx.decompress(data[40:], max_output_size=archive.size_of(i))
+    elif archive.filenames[i].endswith('.blk'):
+        # skip empty file
+        if archive.size_of(i) == 0:
+            return b''
+        packed_type = data[0]
+        # not zstd packed, small blk file, with inner dict?
+        if packed_type == 1:
+            return data[1:]
+        # where that file can be found?
+        elif packed_type == 2:
+            print("packed_type:{}, file:{}".format(packed_type, archive.filenames[i]))
+            return b''
+        # not zstd packed, small blk file?
+        elif packed_type == 3:
+            return data[1:]
+        # zstd packed without dict with namemap
+        elif packed_type == 4:
+            # 200_000 is some working value
+            return dctx.decompress(data[1:], max_output_size=200_000)
+        # zstd packed blk file with dict
+        elif packed_type == 5:
+            return dctx.decompress(data[1:])
+        # not zstd packed, raw text blk file?
+        else:
+            return data
+    else:
+        return data
+
+
+def get_decompressor(archive: VromfsArchive) -> Optional['zstandard.ZstdDecompressor']:
+    """
+    Build zstd decompressor for new vromfs versions, with dictionary, if it present in archive
+    """
+    if not archive.is_new_version:
+        return None
+    import zstandard
+    if archive.filenames[0].endswith('.dict'):
+        zstd_dict = zstandard.ZstdCompressionDict(bytes(archive.get_by_index(0)), dict_type=zstandard.DICT_TYPE_AUTO)
+        # print("dict_id", zstd_dict.dict_id())
+        return zstandard.ZstdDecompressor(dict_data=zstd_dict, format=zstandard.FORMAT_ZSTD1)
+    else:
+        return zstandard.ZstdDecompressor(format=zstandard.FORMAT_ZSTD1)
+
+
+def unpack(filename: os.PathLike, dist_dir: os.PathLike, file_list_path: Optional[os.PathLike] = None,
+           jobs: int = 1, incremental: bool = False, selectors: Iterable[str] = (), regexes: Iterable[str] = (),
+           decode_blk_type: Optional[int] = None, keep_raw: bool = False):
     """
     Unpacks files from vromfs
 
     :param filename: path to vromfs file
     :param dist_dir: path to output dir
     :param file_list_path: path to file list, if you want to unpack only few files, in json list.
+    :param jobs: number of threads for decompressing and writing files
+    :param incremental: unpack only files, changed from previous unpack into `dist_dir`, and delete removed ones
+    :param selectors: unpack only files, matched by paths or globs, like `gamedata/units/**/*.blk`
+    :param regexes: unpack only files, matched by regexes
+    :param decode_blk_type: if set, unpack *.blk files to *.blkx files with this BLK.output_type, like blk_unpack
+    :param keep_raw: if `decode_blk_type` is set, write raw *.blk files too
+    """
+    with VromfsArchive(filename) as archive:
+        selectors = list(selectors)
+        # want to unpack only listed files
+        if file_list_path:
+            with open(file_list_path, 'r') as f:
+                selectors.extend(json.load(f))
+
+        if selectors or regexes:
+            indexes = archive.select(selectors, regexes)
+        else:
+            indexes = list(range(archive.files_count))
+
+        writer = EntryWriter(archive, dist_dir, decode_blk_type, keep_raw)
+        if incremental:
+            manifest_path = get_manifest_path(dist_dir)
+            manifest_options = {'decode_blk_type': decode_blk_type, 'keep_raw': keep_raw}
+            indexes, manifest = update_manifest(archive, indexes, writer,
+                                                load_manifest(manifest_path, manifest_options))
+
+        if jobs > 1:
+            unpack_parallel(archive, indexes, writer, jobs)
+        else:
+            dctx = get_decompressor(archive)
+            with click.progressbar(indexes, label="Unpacking files") as bar:
+                for i in bar:
+                    writer.write(i, dctx)
+
+        if incremental:
+            save_manifest(manifest_path, manifest, manifest_options)
+
+
+def entry_info(archive: VromfsArchive, i: int) -> Dict[str, Any]:
+    """
+    Hash and size of packed file in archive
+    """
+    return {"hash": md5(archive.get_by_index(i)).hexdigest(), "size": archive.size_of(i)}
+
+
+def get_manifest_path(dist_dir: os.PathLike) -> str:
+    """
+    Manifest is stored next to output dir: some.vromfs.bin_u.manifest.json
+    """
+    return os.path.normpath(dist_dir) + '.manifest.json'
+
+
+def load_manifest(manifest_path: str, options: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Load files from manifest, if it was saved with same unpack options
+    """
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('options') != options:
+        return {}
+    return manifest['files']
+
+
+def save_manifest(manifest_path: str, files: Dict[str, Dict[str, Any]], options: Dict[str, Any]):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'options': options, 'files': files}, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def update_manifest(archive: VromfsArchive, indexes: List[int], writer: 'EntryWriter',
+                    old_files: Dict[str, Dict[str, Any]]) -> Tuple[List[int], Dict[str, Dict[str, Any]]]:
+    """
+    Compare files in archive with previous manifest, delete unpacked files, which are not in archive anymore.
+
+    :return: indexes of changed files, that should be unpacked, and new manifest files
+    """
+    files = {path: info for path, info in old_files.items() if path in archive}
+    for path in old_files.keys() - files.keys():
+        for unpacked_filename in writer.unpacked_filenames(path):
+            remove_unpacked(writer.dist_dir, unpacked_filename)
+
+    new_files = {archive.paths[i]: entry_info(archive, i) for i in indexes}
+    # files in new vromfs versions depend on shared zstd dictionary, and decoded blk files - on shared name map,
+    # so if they changed, unpack all
+    shared_indexes = []
+    if archive.is_new_version and archive.filenames[0].endswith('.dict'):
+        shared_indexes.append(0)
+    if archive.is_new_version and writer.decode_blk_type is not None and archive.filenames[-1] == 'nm':
+        shared_indexes.append(archive.files_count - 1)
+    # hashes of shared files are stored, even if they are not selected, so they are compared with next unpack
+    shared_files = {archive.paths[i]: entry_info(archive, i) for i in shared_indexes}
+    shared_changed = any(files.get(path) != info for path, info in shared_files.items())
+
+    changed = []
+    for i in indexes:
+        path = archive.paths[i]
+        if shared_changed or files.get(path) != new_files[path] or \
+                not all(os.path.isfile(f) for f in writer.unpacked_filenames(path)):
+            changed.append(i)
+    files.update(new_files)
+    files.update(shared_files)
+    print("{} files changed, {} removed, {} unchanged".format(
+        len(changed), len(old_files) - len(files.keys() & old_files.keys()), len(indexes) - len(changed)))
+    return changed, files
+
+
+def remove_unpacked(dist_dir: os.PathLike, unpacked_filename: str):
+    """
+    Remove unpacked file and empty dirs, left after it
     """
-    with open(filename, 'rb') as f:
-        data = f.read()
-    parsed = vromfs_file.parse(data)
-
-    # want to unpack only listed files
-    if file_list_path:
-        with open(file_list_path, 'r') as f:
-            file_list = json.load(f)
-
-        # normalise paths in inputted list
-        file_list = [os.path.normcase(p) for p in file_list]
-
-    is_new_version = parsed.is_new_version
-    is_dict_here = parsed.body.data.data.filename_table.filenames[0].filename.endswith('.dict')
-    is_namemap_here = parsed.body.data.data.filename_table.filenames[parsed.body.data.data.files_count-1]\
-        .filename == 'nm'
-    if is_new_version:
-        if is_dict_here:
-            zstd_dict = zstandard.ZstdCompressionDict(parsed.body.data.data.file_data_table.file_data_list[0].data,
-                                                      dict_type=zstandard.DICT_TYPE_AUTO)
-            # print("dict_id", zstd_dict.dict_id())
-            dctx = zstandard.ZstdDecompressor(dict_data=zstd_dict, format=zstandard.FORMAT_ZSTD1)
+    try:
+        os.remove(unpacked_filename)
+        dir_path = os.path.dirname(unpacked_filename)
+        while os.path.normpath(dir_path) != os.path.normpath(dist_dir):
+            os.rmdir(dir_path)
+            dir_path = os.path.dirname(dir_path)
+    except OSError:
+        pass
+
+
+class EntryWriter:
+    """
+    Writes unpacked files from archive to `dist_dir`, *.blk files are decoded to *.blkx, if `decode_blk_type` set
+    """
+    def __init__(self, archive: VromfsArchive, dist_dir: os.PathLike, decode_blk_type: Optional[int] = None,
+                 keep_raw: bool = False):
+        self.archive = archive
+        self.dist_dir = dist_dir
+        self.decode_blk_type = decode_blk_type
+        self.keep_raw = keep_raw
+        self._name_map: Optional[List[str]] = None
+        self._name_map_lock = threading.Lock()
+
+    def get_name_map(self, dctx) -> List[str]:
+        """
+        Shared name map for slim blk files, parsed once per archive
+        """
+        with self._name_map_lock:
+            if self._name_map is None:
+                i = self.archive.files_count - 1
+                if self.archive.filenames[i] != 'nm':
+                    raise WrongFiletypeError("Slim blk file, but no name map in vromfs")
+                self._name_map = parse_name_map(unpack_entry(self.archive, i, dctx))
+            return self._name_map
+
+    def decode_blk(self, i: int, data, dctx) -> str:
+        if len(data) == 0:
+            return ''
+        if self.archive.is_new_version:
+            packed_type = self.archive.get_by_index(i)[0]
+            # fat blk, with own names
+            if packed_type == 1:
+                return SlimBLK(bytes(data)).unpack(self.decode_blk_type)
+            # slim blk, with names from shared name map
+            elif packed_type in (3, 4, 5):
+                return SlimBLK(bytes(data), self.get_name_map(dctx)).unpack(self.decode_blk_type)
+        return decode_blk(bytes(data), self.decode_blk_type, False)
+
+    def is_decoded(self, path: str) -> bool:
+        return self.decode_blk_type is not None and path.endswith('.blk')
+
+    def unpacked_filenames(self, path: str) -> List[str]:
+        unpacked_filename = os.path.join(self.dist_dir, path)
+        if not self.is_decoded(path):
+            return [unpacked_filename]
+        elif self.keep_raw:
+            return [unpacked_filename, unpacked_filename + 'x']
         else:
-            dctx = zstandard.ZstdDecompressor(format=zstandard.FORMAT_ZSTD1)
-
-    with click.progressbar(range(parsed.body.data.data.files_count), label="Unpacking files") as bar:
-        for i in bar:
-            vromfs_internal_file_path = parsed.body.data.data.filename_table.filenames[i].filename
-            # clean leading slashes, there was a bug in 1.99.1.70 with "/version" file path
-            vromfs_internal_file_path = vromfs_internal_file_path.lstrip('/\\')
-            if file_list_path:
-                # TODO should be mostly the same as normal path, dedup
-                # FIXME this branch may be broken now
-                if os.path.normcase(vromfs_internal_file_path) in file_list:
-                    unpacked_filename = os.path.join(dist_dir, vromfs_internal_file_path)
-                    mkdir_p(unpacked_filename)
-                    with open(unpacked_filename, 'wb') as f:
-                        if is_new_version and is_dict_here and i != 0 and unpacked_filename.endswith('.blk'):
-                            f.write(dctx.decompress(parsed.body.data.data.file_data_table.file_data_list[i].data))
-                        else:
-                            f.write(parsed.body.data.data.file_data_table.file_data_list[i].data)
-            else:
-                unpacked_filename = os.path.join(dist_dir, vromfs_internal_file_path)
-                mkdir_p(unpacked_filename)
-                with open(unpacked_filename, 'wb') as f:
-                    if is_new_version:
-                        if is_dict_here and i == 0:
-                            f.write(parsed.body.data.data.file_data_table.file_data_list[i].data)
-                        # last file `?nm` - name map
-                        # skip first 40 bytes, unpack, and few start bytes in unpacked namemap is unknown
-                        elif is_namemap_here and i == parsed.body.data.data.files_count - 1:
-                            name_map_decompressed = dctx.decompress(
-                                parsed.body.data.data.file_data_table.file_data_list[i].data[40:],
-                                max_output_size=parsed.body.data.data.file_data_table.file_data_list[i].file_data_size)
-                            f.write(name_map_decompressed)
-                        elif unpacked_filename.endswith('.blk'):
-                            # print(unpacked_filename)
-                            # skip empty file
-                            if parsed.body.data.data.file_data_table.file_data_list[i].file_data_size == 0:
-                                continue
-                            packed_type = parsed.body.data.data.file_data_table.file_data_list[i].data[0]
-                            # not zstd packed, small blk file, with inner dict?
-                            if packed_type == 1:
-                                f.write(parsed.body.data.data.file_data_table.file_data_list[i].data[1:])
-                            # where that file can be found?
-                            elif packed_type == 2:
-                                print("packed_type:{}, file:{}".format(packed_type, unpacked_filename))
-                            # not zstd packed, small blk file?
-                            elif packed_type == 3:
-                                f.write(parsed.body.data.data.file_data_table.file_data_list[i].data[1:])
-                            # zstd packed without dict with namemap
-                            elif packed_type == 4:
-                                decoded_data = dctx.decompress(
-                                    parsed.body.data.data.file_data_table.file_data_list[i].data[1:],
-                                    # 200_000 is some working value
-                                    max_output_size=200_000)
-                                f.write(decoded_data)
-                            # zstd packed blk file with dict
-                            elif packed_type == 5:
-                                dict_decoded_data = dctx.decompress(
-                                    parsed.body.data.data.file_data_table.file_data_list[i].data[1:])
-                                f.write(dict_decoded_data)
-                            # not zstd packed, raw text blk file?
-                            else:
-                                # print("unknown packed_type:{}, file:{}".format(packed_type,unpacked_filename))
-                                f.write(parsed.body.data.data.file_data_table.file_data_list[i].data)
-                        else:
-                            f.write(parsed.body.data.data.file_data_table.file_data_list[i].data)
-                    # older blk versions
-                    else:
-                        f.write(parsed.body.data.data.file_data_table.file_data_list[i].data)
+            return [unpacked_filename + 'x']
+
+    def write(self, i: int, dctx):
+        path = self.archive.paths[i]
+        unpacked_filename = os.path.join(self.dist_dir, path)
+        mkdir_p(unpacked_filename)
+        data = unpack_entry(self.archive, i, dctx)
+        if self.is_decoded(path):
+            try:
+                decoded_data = self.decode_blk(i, data, dctx)
+            except Exception as e:
+                # keep file, which can't be decoded, as is; broken blk can fail decoder with any error, which
+                # shouldn't stop unpacking of other files
+                error = e if isinstance(e, WrongFiletypeError) else '{}: {}'.format(type(e).__name__, e)
+                print("\n{}: {}".format(path, error))
+                decoded_data = None
+            if decoded_data is not None:
+                with open(unpacked_filename + 'x', 'w', newline='', encoding='utf-8') as f:
+                    f.write(decoded_data)
+                if not self.keep_raw:
+                    return
+        with open(unpacked_filename, 'wb') as f:
+            f.write(data)
+
+
+def unpack_parallel(archive: VromfsArchive, indexes: List[int], writer: EntryWriter, jobs: int):
+    """
+    Unpack files with pool of threads: zstd decompression and file writes release GIL.
+    Each thread builds own decompressor, and only few files per thread are in flight, so memory stays bounded.
+    """
+    from concurrent.futures import ThreadPoolExecutor, Future, wait, as_completed, FIRST_COMPLETED
+
+    thread_data = threading.local()
+
+    def worker(i: int):
+        if not hasattr(thread_data, 'dctx'):
+            thread_data.dctx = get_decompressor(archive)
+        writer.write(i, thread_data.dctx)
+
+    max_in_flight = jobs * 2
+    with ThreadPoolExecutor(max_workers=jobs) as executor, \
+            click.progressbar(length=len(indexes), label="Unpacking files") as bar:
+        in_flight: Set[Future] = set()
+        for i in indexes:
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                bar.update(len(done))
+            in_flight.add(executor.submit(worker, i))
+        for future in as_completed(in_flight):
+            future.result()
+            bar.update(1)
 
 
 def files_list_info(filename: os.PathLike, dist_file: Optional[os.PathLike]) -> Optional[str]:
-    with open(filename, 'rb') as f:
-        data = f.read()
-    parsed = vromfs_file.parse(data)
     out_list = []
-
-    for i in range(parsed.body.data.data.files_count):
-        m = md5(parsed.body.data.data.file_data_table.file_data_list[i].data).hexdigest()
-        out_list.append({"filename": os.path.normcase(parsed.body.data.data.filename_table.filenames[i]), "hash": m})
+    with VromfsArchive(filename) as archive:
+        for i in range(archive.files_count):
+            out_list.append({"filename": os.path.normcase(archive.filenames[i]), **entry_info(archive, i)})
     out_json = json.dumps({'version': 1, 'filelist': out_list})
     if not dist_file:
         return out_json
@@ -145,7 +346,16 @@ def files_list_info(filename: os.PathLike, dist_file: Optional[os.PathLike]) ->
 @click.option('-O', '--output', 'output_path', type=click.Path(), default=None)
 @click.option('--metadata', 'metadata', is_flag=True, default=False)
 @click.option('--input_filelist', 'input_filelist', type=click.Path(), default=None)
-def main(filename: os.PathLike, output_path: Optional[os.PathLike], metadata: bool, input_filelist: Optional[os.PathLike]):
+@click.option('--select', 'selectors', multiple=True)
+@click.option('--regex', 'regexes', multiple=True)
+@click.option('--jobs', 'jobs', type=click.IntRange(min=1), default=1, show_default=True)
+@click.option('--incremental', 'incremental', is_flag=True, default=False)
+@click.option('--decode_blk', '--decode-blk', 'decode_blk_format',
+              type=click.Choice(['json', 'json_min', 'strict_blk', 'json_2'], case_sensitive=False), default=None)
+@click.option('--keep_raw', '--keep-raw', 'keep_raw', is_flag=True, default=False)
+def main(filename: os.PathLike, output_path: Optional[os.PathLike], metadata: bool, input_filelist: Optional[os.PathLike],
+         selectors: Tuple[str, ...], regexes: Tuple[str, ...], jobs: int, incremental: bool,
+         decode_blk_format: Optional[str], keep_raw: bool):
     """
     vromfs_unpacker: unpacks vromfs file into folder
 
@@ -157,7 +367,23 @@ def main(filename: os.PathLike, output_path: Optional[os.PathLike], metadata: bo
     prints to file instead.
 
     --input_filelist: pass the file with list of files you want to unpack and only this files will be unpacked.
-    Files should be a json list format, like: `["buildtstamp", "gamedata/units/tankmodels/fr_b1_ter.blk"]`
+    Files should be a json list format, like: `["buildtstamp", "gamedata/units/tankmodels/fr_b1_ter.blk"]`, globs
+    can be used too.
+
+    --select: unpack only files, matched by path or glob, like `gamedata/units/**/*.blk`: `*` and `?` don't match
+    `/`, `**/` matches any number of folders. Can be used few times.
+
+    --regex: unpack only files, which paths fully matched by regex. Can be used few times.
+
+    --jobs: number of threads, used to decompress and write files, by default files unpacked one by one.
+
+    --incremental: unpack only files, changed since previous unpack to same folder, and delete files, removed from
+    vromfs. Hashes of files are stored in manifest next to output folder, like some.vromfs.bin_u.manifest.json
+
+    --decode_blk: unpack blk files straight to blkx files in chosen format, like blk_unpack does, without writing
+    raw blk files. Blk files, which can't be decoded, are written as is.
+
+    --keep_raw: with --decode_blk, write raw blk files too.
 
     example: `vromfs_unpacker some.vromfs.bin` will unpack content to some.vromfs.bin_u folder. If you want to unpack to
     custom folder, use `vromfs_unpacker some.vromfs.bin --output my_folder`, that will unpack some.vromfs.bin folder to
@@ -178,7 +404,8 @@ def main(filename: os.PathLike, output_path: Optional[os.PathLike], metadata: bo
         else:
             head, tail = os.path.split(filename)
             output_path = os.path.join(head, tail + '_u')
-        unpack(filename, output_path, input_filelist)
+        decode_blk_type = BLK.output_type[decode_blk_format.lower()] if decode_blk_format else None
+        unpack(filename, output_path, input_filelist, jobs, incremental, selectors, regexes, decode_blk_type, keep_raw)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,93 @@
+"""
+Microbenchmark for blk value decoding, not collected by pytest.
+
+Run from repo root:
+    python tests/bench_blk_unpack.py [file.blk ...]
+
+Without arguments decodes synthetic block with values of all types, with `.blk` files - also times whole decoding
+of each file.
+"""
+import struct
+import sys
+import time
+
+sys.path.insert(0, 'src/wt_tools')
+
+from blk_unpack import BLK  # noqa: E402
+
+# type byte: values, packed in same way as in blk
+synthetic_values = [
+    (0x1, struct.pack('<I', 1)),
+    (0x2, struct.pack('<i', -100)),
+    (0x3, struct.pack('<f', 0.5)),
+    (0x4, struct.pack('<2f', 1.0, 2.0)),
+    (0x5, struct.pack('<3f', 1.0, 2.0, 3.0)),
+    (0x6, struct.pack('<4f', 1.0, 2.0, 3.0, 4.0)),
+    (0x7, struct.pack('<2I', 1, 2)),
+    (0x8, struct.pack('<3I', 1, 2, 3)),
+    (0x9, b''),
+    (0xa, struct.pack('<I', 0x6120f00)),
+    (0xb, struct.pack('<12f', *range(12))),
+    (0xc, struct.pack('<2I', 1, 2)),
+    (0x10, struct.pack('<I', 1)),
+    (0x89, b''),
+]
+
+
+def build_synthetic(repeat: int):
+    data = bytearray()
+    offsets = []
+    for i in range(repeat):
+        for block_type, value in synthetic_values:
+            offsets.append((len(data), block_type))
+            data += struct.pack('<HBB', i & 0xffff, 1, block_type) + value
+    return bytes(data), offsets
+
+
+def bench_values(repeat: int = 20000, rounds: int = 5) -> float:
+    data, offsets = build_synthetic(repeat)
+    blk = BLK(data)
+    get_block_value = blk.get_block_value
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for offset, block_type in offsets:
+            get_block_value(offset, block_type)
+        best = min(best, time.perf_counter() - start)
+    return len(offsets) / best
+
+
+def bench_file(path: str, rounds: int = 3):
+    with open(path, 'rb') as f:
+        data = f.read()
+    values_count = 0
+    get_block_value = BLK.get_block_value
+
+    def counting_get_block_value(self, id_offset, block_type):
+        nonlocal values_count
+        values_count += 1
+        return get_block_value(self, id_offset, block_type)
+
+    best = float('inf')
+    BLK.get_block_value = counting_get_block_value
+    try:
+        BLK(data)._decode()
+    finally:
+        BLK.get_block_value = get_block_value
+    for _ in range(rounds):
+        start = time.perf_counter()
+        BLK(data)._decode()
+        best = min(best, time.perf_counter() - start)
+    return values_count, best
+
+
+def main():
+    print('get_block_value: {:.0f} values/s'.format(bench_values()))
+    for path in sys.argv[1:]:
+        values_count, elapsed = bench_file(path)
+        print('{}: {} values, decoded in {:.3f}s, {:.0f} values/s'.format(
+            path, values_count, elapsed, values_count / elapsed))
+
+
+if __name__ == '__main__':
+    main()
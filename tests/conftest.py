@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='session')
+def cache_dir(tmp_path_factory):
+    """
+    Keep cached data of tools, like parse tables of text blk, out of user cache folder.
+    """
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        path = tmp_path_factory.mktemp('cache')
+        monkeypatch.setenv('XDG_CACHE_HOME', str(path))
+        monkeypatch.setenv('LOCALAPPDATA', str(path))
+        yield path
@@ -0,0 +1,69 @@
+import os
+
+from src.wt_tools import blk_unpack
+from src.wt_tools.formats.blk_cache import BlkCache
+
+
+def test_cache_get_put(tmp_path):
+    cache = BlkCache(tmp_path / 'cache')
+    decoded = tmp_path / 'a.blkx'
+    decoded.write_text('{"a": 1}')
+    key = cache.key(b'\x00BBF', 0, False)
+    assert key != cache.key(b'\x00BBF', 0, True)
+    assert key != cache.key(b'\x00BBF', 1, False)
+
+    out = tmp_path / 'b.blkx'
+    assert not cache.get(key, out)
+    cache.put(key, decoded)
+    assert cache.get(key, out)
+    assert out.read_text() == '{"a": 1}'
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = BlkCache(tmp_path / 'cache', max_size=20)
+    decoded = tmp_path / 'a.blkx'
+    decoded.write_text('x' * 10)
+    keys = [cache.key(bytes([i]), 0, False) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, decoded)
+        os.utime(cache.path_of(key), (i, i))
+    # first file is used now
+    assert cache.get(keys[0], tmp_path / 'b.blkx')
+
+    assert cache.evict() == 1
+    assert os.path.exists(cache.path_of(keys[0]))
+    assert not os.path.exists(cache.path_of(keys[1]))
+    assert os.path.exists(cache.path_of(keys[2]))
+
+
+def test_cache_not_writable(tmp_path):
+    # cache dir can't be created, file is in its place
+    (tmp_path / 'cache').write_bytes(b'')
+    cache = BlkCache(tmp_path / 'cache', max_size=0)
+    decoded = tmp_path / 'a.blkx'
+    decoded.write_text('{"a": 1}')
+    key = cache.key(b'\x00BBF', 0, False)
+    assert not cache.put(key, decoded)
+    assert not cache.get(key, tmp_path / 'b.blkx')
+    assert cache.evict() == 0
+
+    blk = tmp_path / 'c.blk'
+    blk.write_bytes(b'a:i=1\n')
+    blk_unpack.unpack_file(str(blk), blk_unpack.BLK.output_type['json'], False, cache)
+    assert (tmp_path / 'c.blkx').read_text() == 'a:i=1\n'
+
+
+def test_cached_text_blk_validated(tmp_path):
+    cache = BlkCache(tmp_path / 'cache')
+    json_type = blk_unpack.BLK.output_type['json']
+    # text blk with wrong number, which is found by grammar only
+    blk = tmp_path / 'a.blk'
+    blk.write_bytes(b'a:r=1.2.3\n')
+    blkx = tmp_path / 'a.blkx'
+    blk_unpack.unpack_file(str(blk), json_type, False, cache)
+    assert blkx.read_bytes() == b'a:r=1.2.3\n'
+    assert cache.get(cache.key(b'a:r=1.2.3\n', json_type, False), tmp_path / 'b.blkx')
+
+    blkx.unlink()
+    blk_unpack.unpack_file(str(blk), json_type, False, cache, validate=True)
+    assert not blkx.exists()
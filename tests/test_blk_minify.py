@@ -1,4 +1,8 @@
-from src.wt_tools.blk_minify import minify
+import os
+
+import pytest
+
+from src.wt_tools.blk_minify import BlkSyntaxError, engines, iter_input_files, minify, minify_files
 
 strip_options = {
     'strip_empty_objects': False,
@@ -7,104 +11,203 @@ strip_options = {
 }
 
 
+@pytest.fixture(params=engines)
+def engine(request):
+    return request.param
+
+
 class TestKeyTypeValueSimples:
-    def test_key_type_value_r(self):
+    def test_key_type_value_r(self, engine):
         data = "density:r = 0.75"
         expected = "density:r=0.75"
-        actual = minify(data, strip_options)
+        actual = minify(data, strip_options, engine)
         assert actual == expected, "zzz"
 
-    def test_key_type_value_i(self):
+    def test_key_type_value_i(self, engine):
         data = "texSize:i = 256"
         expected = "texSize:i=256"
-        actual = minify(data, strip_options)
+        actual = minify(data, strip_options, engine)
         assert actual == expected, "zzz"
 
-    def test_key_type_value_t(self):
+    def test_key_type_value_t(self, engine):
         data = 'collision:t = "Unigine"'
         expected = 'collision:t="Unigine"'
-        actual = minify(data, strip_options)
+        actual = minify(data, strip_options, engine)
         assert actual == expected, "zzz"
 
-    def test_key_type_value_b(self):
+    def test_key_type_value_b(self, engine):
         data = "refl:b=yes"
         expected = "refl:b=yes"
-        actual = minify(data, strip_options)
+        actual = minify(data, strip_options, engine)
         assert actual == expected, "zzz"
 
-    def test_key_type_value_c(self):
+    def test_key_type_value_c(self, engine):
         data = "volfogColor:c=234, 237, 240, 255"
         expected = "volfogColor:c=234,237,240,255"
-        actual = minify(data, strip_options)
+        actual = minify(data, strip_options, engine)
         assert actual == expected, "zzz"
 
-    def test_key_type_value_p2(self):
+    def test_key_type_value_p2(self, engine):
         data = "fadeK:p2=16, 5.49"
         expected = "fadeK:p2=16,5.49"
-        actual = minify(data, strip_options)
+        actual = minify(data, strip_options, engine)
         assert actual == expected, "zzz"
 
-    def test_key_type_value_p3(self):
+    def test_key_type_value_p3(self, engine):
         data = "fadeK:p2=16, 5.49, 0"
         expected = "fadeK:p2=16,5.49,0"
-        actual = minify(data, strip_options)
+        actual = minify(data, strip_options, engine)
         assert actual == expected, "zzz"
 
-    def test_key_type_value_p4(self):
+    def test_key_type_value_p4(self, engine):
         data = "fadeK:p2=16, 5.49, 0, 1"
         expected = "fadeK:p2=16,5.49,0,1"
-        actual = minify(data, strip_options)
+        actual = minify(data, strip_options, engine)
         assert actual == expected, "zzz"
 
-    def test_key_type_value_ip2(self):
+    def test_key_type_value_ip2(self, engine):
         data = "numActiveChunks:ip2=40, 80 "
         expected = "numActiveChunks:ip2=40,80"
-        actual = minify(data, strip_options)
+        actual = minify(data, strip_options, engine)
         assert actual == expected, "zzz"
 
-    def test_key_type_value_ip3(self):
+    def test_key_type_value_ip3(self, engine):
         data = "size:ip3=32, 16, 16 "
         expected = "size:ip3=32,16,16"
-        actual = minify(data, strip_options)
+        actual = minify(data, strip_options, engine)
         assert actual == expected, "zzz"
 
-    def test_key_type_value_m(self):
+    def test_key_type_value_m(self, engine):
         data = "tm:m=[[1.0, 0.0, 0.0] [0.0, 1.0, 0.0] [0.0, 0.0, 1.0] [0.0, 0.0, 0.0]] "
         expected = "tm:m=[[1.0,0.0,0.0][0.0,1.0,0.0][0.0,0.0,1.0][0.0,0.0,0.0]]"
-        actual = minify(data, strip_options)
+        actual = minify(data, strip_options, engine)
         assert actual == expected, "zzz"
 
 
-def test_empty_file():
+def test_empty_file(engine):
     data = ""
     expected = ""
-    actual = minify(data, strip_options)
+    actual = minify(data, strip_options, engine)
     assert actual == expected, "zzz"
 
 
-def test_newlines():
+def test_newlines(engine):
     data = \
     """
     
     """
     expected = ""
-    actual = minify(data, strip_options)
+    actual = minify(data, strip_options, engine)
     assert actual == expected, "zzz"
 
 
-def test_empty_object():
+@pytest.mark.parametrize('data', [' ;; ', '// only comment\n', '\n// comment;\n;\n'])
+def test_no_statements(engine, data):
+    assert minify(data, strip_options, engine) == ''
+
+
+def test_empty_object(engine):
     data = "some{}"
     expected = "some{}"
-    actual = minify(data, strip_options)
+    actual = minify(data, strip_options, engine)
     assert actual == expected, "zzz"
 
 
-def test_empty_object_with_newlines():
+def test_empty_object_with_newlines(engine):
     data = \
     """
     some{
     }
     """
     expected = "some{}"
-    actual = minify(data, strip_options)
+    actual = minify(data, strip_options, engine)
     assert actual == expected, "zzz"
+
+
+def test_statements_separators(engine):
+    data = \
+    """
+    a:i=1 // comment
+    b{
+      c:t="x // y"; d:p2=1, 2
+      e{
+      }
+    }
+    f:b=yes
+    """
+    expected = 'a:i=1;b{c:t="x // y";d:p2=1,2;e{}}f:b=yes'
+    actual = minify(data, strip_options, engine)
+    assert actual == expected
+
+
+@pytest.mark.parametrize('option, expected', [
+    ('strip_empty_objects', 'a:i=1;b{d{e:i=1;}__f{g:i=1;}}'),
+    ('strip_comment_objects', 'a:i=1;b{c{}d{e:i=1;}__f{g:i=1;}}'),
+    ('strip_disabled_objects', 'a:i=1;b{c{}d{e:i=1;}comment{}}'),
+])
+def test_strip_objects(engine, option, expected):
+    data = \
+    """
+    a:i=1
+    b{
+      c{
+      }
+      d{
+        e:i=1
+      }
+      comment{
+      }
+      __f{
+        g:i=1
+      }
+    }
+    h{
+    }
+    """
+    options = dict(strip_options)
+    options[option] = True
+    if option != 'strip_empty_objects':
+        expected += 'h{}'
+    actual = minify(data, options, engine)
+    assert actual == expected
+
+
+@pytest.mark.parametrize('data, options, expected', [
+    # lark drops `;`, which ends value after object
+    ('n-2 {}\n\n"quoted name" :c = 1,2,3,4;\n\na:r=\n', {}, 'n-2{}"quoted name":c=1,2,3,4;a:r='),
+    ('a{}\nb:i=1;\nc:i=2\n', {}, 'a{}b:i=1;c:i=2'),
+    # so it's dropped before stripped object too, fast keeps it, like after value without object before it
+    ('a{}\nb:i=1;\nc{}\n', {'strip_empty_objects': True}, 'b:i=1;'),
+    ('b:i=1;\nc{}\n', {'strip_empty_objects': True}, 'b:i=1;'),
+    # lark rejects empty statement in object
+    ('a{;}b:i=1', {}, 'a{}b:i=1'),
+])
+def test_fast_differs_from_lark(data, options, expected):
+    """
+    Fast minifier gives same output, as lark one, except this cases, where lark output is wrong or lark fails
+    """
+    assert minify(data, dict(strip_options, **options), 'fast') == expected
+
+
+@pytest.mark.parametrize('data', ['a:i=1 b:i=2', 'a{\nb:i=1\n', 'a:i=1\n}', 'a:q=1'])
+def test_fast_syntax_error(data):
+    with pytest.raises(BlkSyntaxError):
+        minify(data, strip_options, 'fast')
+
+
+def test_minify_files(tmp_path, engine):
+    src = tmp_path / 'src'
+    (src / 'sub').mkdir(parents=True)
+    (src / 'a.blk').write_text('a:i = 1\n')
+    (src / 'a.min.blk').write_text('a:i=1')
+    (src / 'sub' / 'b.blk').write_text('b{\n  c:r = 0.5\n}\n')
+    (src / 'sub' / 'bad.blk').write_text('a:i=1 b{')
+
+    input_files = list(iter_input_files([str(src), str(src / '*.blk')]))
+    assert [rel_path for _, rel_path in input_files] == ['a.blk', os.path.join('sub', 'b.blk'),
+                                                         os.path.join('sub', 'bad.blk'), 'a.min.blk']
+    out = tmp_path / 'out'
+    tasks = [(filename, str(out / rel_path), strip_options, engine) for filename, rel_path in input_files]
+    assert minify_files(tasks) == (3, 30, 21, 1)
+    assert (out / 'sub' / 'b.blk').read_text() == 'b{c:r=0.5;}'
+    assert not (out / 'sub' / 'bad.blk').exists()
@@ -1,6 +1,8 @@
+import io
 import pytest
 import tempfile
 import os.path
+import struct
 from src.wt_tools import blk_unpack
 
 test_data_folder = "data_for_tests"
@@ -102,3 +104,78 @@ class TestNewBlk:
                                                      blk_unpack.BLK.output_type['json'])
         assert result_data == expected_data, "Wrong output blkx"
 
+
+
+class TestSlimBlk:
+    names = ['a', 'b', 'blk']
+    name_map_data = b'\x03\x08a\x00b\x00blk\x00'
+    # no own names, 2 blocks, 3 params, no params data
+    slim_data = b'\x00\x02\x03\x00' + \
+        struct.pack('<II', 0 | 0x2 << 24, 1) + \
+        struct.pack('<II', 1 | 0x1 << 24, 0x80000000 | 2) + \
+        struct.pack('<If', 0 | 0x3 << 24, 0.5) + \
+        b'\x00\x02\x01\x01' + b'\x03\x01\x00'
+
+    def test_parse_name_map(self):
+        assert blk_unpack.parse_name_map(self.name_map_data) == self.names
+
+    def test_slim_blk_with_shared_name_map(self):
+        blk = blk_unpack.SlimBLK(self.slim_data, self.names)
+        assert blk.unpack(blk_unpack.BLK.output_type['json_min']) == '{"a":1,"b":"blk","blk":{"a":0.5}}'
+
+    def test_slim_blk_in_strict_blk_mode(self):
+        blk = blk_unpack.SlimBLK(self.slim_data, self.names)
+        assert blk.unpack(blk_unpack.BLK.output_type['strict_blk']) == 'a:i=1\nb:t="blk"\n\nblk{\n  a:r=0.5\n}'
+
+    def test_slim_blk_decoded_once_for_all_formats(self):
+        blk = blk_unpack.SlimBLK(self.slim_data, self.names)
+        tree = blk.decode()
+        assert blk.unpack(blk_unpack.BLK.output_type['json_2']) == \
+            '{\n  "a": [\n    1\n  ],\n  "b": [\n    "blk"\n  ],\n  "blk": [\n    {\n      "a": [\n        0.5\n' \
+            '      ]\n    }\n  ]\n}'
+        assert blk.unpack(blk_unpack.BLK.output_type['json_min']) == '{"a":1,"b":"blk","blk":{"a":0.5}}'
+        assert blk.tree is tree
+        assert list(tree.children(0)) == [1]
+        assert [tree.param_name(param_id) for param_id in tree.params(1)] == ['a']
+
+    def test_json_writer_with_duplicates_and_vectors(self):
+        # one block, 2 params with same name: vec2f from params data and int
+        slim_data = b'\x00\x01\x02\x08' + struct.pack('<2f', 1.0, 2.0) + \
+            struct.pack('<II', 0 | 0x4 << 24, 0) + \
+            struct.pack('<II', 0 | 0x2 << 24, 1) + \
+            b'\x00\x02\x00'
+        tree = blk_unpack.SlimBLK(slim_data, self.names).decode()
+        stream = io.StringIO()
+        blk_unpack.BlkJsonWriter(tree).write_json(stream)
+        assert stream.getvalue() == '[\n  {\n    "a": [1.0,2.0]\n  },\n  {\n    "a": 1\n  }\n]'
+        stream = io.StringIO()
+        blk_unpack.BlkJsonWriter(tree, indent=None).write_json(stream)
+        assert stream.getvalue() == '[{"a":[1.0,2.0]},{"a":1}]'
+
+    def test_slim_blk_unpack_to_stream(self):
+        blk = blk_unpack.SlimBLK(self.slim_data, self.names)
+        for out_type in blk_unpack.BLK.output_type.values():
+            stream = io.StringIO()
+            blk.unpack_to(stream, out_type)
+            assert stream.getvalue() == blk.unpack(out_type)
+
+
+@pytest.mark.parametrize('data, expected', [
+    (b'\x00BBF\x03\x00', 'binary'),
+    (b'\x00BBz', 'binary'),
+    (b'density:r = 0.75', 'text'),
+    (b'// comment\n\n"random from":i=0', 'text'),
+    (b'some{\n}', 'text'),
+    (b'', 'other'),
+    (b'\n\n', 'other'),
+    (b'// only comment', 'other'),
+    (b'density:x=0.75', 'other'),
+    (b'some{{{', 'other'),
+    # empty numbers list is allowed by grammar
+    (b'density:r=\nsome{\n  a:p2=;b:i=1\n}', 'text'),
+    (b'some{\n  a:p2=16, 5.49\n  tm:m=[[1.0, 0.0, 0.0] [0.0, 1.0, 0.0]]\n}\n', 'text'),
+    (b'\x01\x02\x03', 'other'),
+    (b'\xff\xfe\x00', 'other'),
+])
+def test_sniff_blk(data, expected):
+    assert blk_unpack.sniff_blk(data) == expected
@@ -0,0 +1,110 @@
+import os
+import random
+import struct
+import zlib
+
+import pytest
+
+from src.wt_tools.ddsx_unpack import DDSXError, unpack, unpack_dir
+from formats.ddsx_codecs import Codec, OodleCodec, codecs, register_codec
+from formats.ddsx_header import DDSXHeader
+from formats.ddsx_parser import ddsx_header
+
+FLG_REV_MIP_ORDER = 0x40000
+FLG_OODLE = 0x60000000
+FLG_ZLIB = 0x80000000
+# wrap addressing by u and v
+ADDR_WRAP = 0x11
+
+# DXT1 8x8 texture with 2 levels: 2x2 blocks of 8 bytes and one block
+mip_0 = bytes(range(32))
+mip_1 = b'\xff' * 8
+
+
+def build_ddsx(texture_format=b'DXT1', flags=FLG_ZLIB | FLG_REV_MIP_ORDER | ADDR_WRAP, body=mip_1 + mip_0):
+    packed = zlib.compress(body) if flags & FLG_ZLIB else body
+    header = struct.pack('<4s4sIHHBBHHHII', b'DDSx', texture_format, flags, 8, 8, 2, 0, 1, 4, 0, len(body),
+                         len(packed) if flags & FLG_ZLIB else 0)
+    return header + packed
+
+
+def test_unpack_reversed_mips():
+    dds = unpack(build_ddsx())
+    assert dds[:4] == b'DDS '
+    assert struct.unpack_from('<III', dds, 0xc) == (8, 8, 40)
+    assert dds[0x54:0x58] == b'DXT1'
+    assert dds[0x80:] == mip_0 + mip_1
+
+
+def test_unpack_reversed_mips_only_flag():
+    # only flag of mips order set, without addressing bits
+    assert unpack(build_ddsx(flags=FLG_REV_MIP_ORDER))[0x80:] == mip_0 + mip_1
+
+
+def test_header_same_as_construct():
+    rnd = random.Random(23)
+    fields = ['d3dFormat', 'w', 'h', 'levels', 'hqPartLevels', 'depth', 'bitsPerPixel', 'memSz', 'packedSz']
+    nibbles = ['lQmip', 'mQmip', 'dxtShift', 'uQmip']
+    for _ in range(100):
+        data = b'DDSx' + bytes(rnd.getrandbits(8) for _ in range(28))
+        header = DDSXHeader.parse(data)
+        reference = ddsx_header.parse(data)
+        assert [getattr(header, field) for field in fields] == [reference[field] for field in fields]
+        assert [getattr(header, field) for field in nibbles] == [reference.bits_[field] for field in nibbles]
+        assert header.compression == data[0xb] & 0xe0
+
+
+def test_header_not_ddsx():
+    with pytest.raises(ValueError, match='label'):
+        DDSXHeader.parse(b'DDS ' + bytes(28))
+    with pytest.raises(ValueError, match='size'):
+        DDSXHeader.parse(b'DDSx')
+
+
+def test_unpack_dir_collects_errors(tmp_path):
+    for i in range(10):
+        (tmp_path / 'tex{}.ddsx'.format(i)).write_bytes(build_ddsx())
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'plain.ddsx').write_bytes(build_ddsx(flags=ADDR_WRAP, body=mip_0 + mip_1))
+    (tmp_path / 'sub' / 'argb.ddsx').write_bytes(build_ddsx(texture_format=b'ARGB'))
+    (tmp_path / 'sub' / 'empty.ddsx').write_bytes(b'')
+
+    # budget lower than one file, so files are unpacked one by one
+    unpacked_count, errors = unpack_dir(str(tmp_path), jobs=4, max_in_flight_size=16)
+    assert unpacked_count == 11
+    assert [(filename[len(str(tmp_path)) + 1:], error) for filename, error in errors] == [
+        (os.path.join('sub', 'argb.ddsx'), "Texture format b'ARGB' unsupported yet"),
+        (os.path.join('sub', 'empty.ddsx'), 'empty file'),
+    ]
+    for i in range(10):
+        assert (tmp_path / 'tex{}.dds'.format(i)).read_bytes()[0x80:] == mip_0 + mip_1
+    assert (tmp_path / 'sub' / 'plain.dds').read_bytes()[0x80:] == mip_0 + mip_1
+
+
+class ReversedCodec(Codec):
+    name = 'reversed'
+
+    def decompress(self, data, body, mem_size, packed_size):
+        return bytes(body)[::-1]
+
+
+@pytest.fixture
+def oodle_codec():
+    codec = codecs[0x60]
+    yield
+    register_codec(0x60, codec)
+
+
+def test_registered_codec(oodle_codec):
+    codec = ReversedCodec()
+    register_codec(0x60, codec)
+    data = build_ddsx(flags=FLG_OODLE | ADDR_WRAP, body=(mip_0 + mip_1)[::-1])
+    assert unpack(data)[0x80:] == mip_0 + mip_1
+    assert (codec.count, codec.packed_size, codec.unpacked_size) == (1, 40, 40)
+    assert codec.stats().startswith('reversed: 1 textures')
+
+
+def test_oodle_without_library(oodle_codec):
+    register_codec(0x60, OodleCodec(lib_paths=[]))
+    with pytest.raises(DDSXError, match='oodle'):
+        unpack(build_ddsx(flags=FLG_OODLE | ADDR_WRAP))
@@ -0,0 +1,127 @@
+import struct
+import sys
+import zlib
+
+import pytest
+
+from src.wt_tools import dxp_unpack
+from formats.dxp_archive import DxpArchive
+
+FLG_ZLIB = 0x80000000
+# wrap addressing by u and v
+ADDR_WRAP = 0x11
+
+# DXT1 4x4 textures with one level, one block of 8 bytes
+textures = [('tex_a', bytes(range(8))), ('tex_b', b'\xff' * 8), ('tex_c', b'\x01' * 8)]
+
+
+def build_dxp(textures):
+    """
+    Build dxp archive: header, names, offsets blocks, ddsx headers, records with offset and size of bodies, bodies.
+    """
+    names = b''.join(name.encode() + b'*suffix\0' for name, body in textures)
+    names_end = 0x48 + len(names)
+    block_1_offset = names_end + (-names_end % 0x10)
+    dds_block_offset = block_1_offset + 0x8 * len(textures)
+    block_3_offset = dds_block_offset + 0x20 * len(textures)
+    bodies_offset = block_3_offset + 0x18 * len(textures)
+
+    dds_block = b''
+    block_3 = b''
+    bodies = b''
+    for name, body in textures:
+        packed = zlib.compress(body)
+        dds_block += struct.pack('<4s4sIHHBBHHHII', b'DDSx', b'DXT1', FLG_ZLIB | ADDR_WRAP, 4, 4, 1, 0, 1, 4, 0,
+                                 len(body), len(packed))
+        block_3 += struct.pack('<12xII4x', bodies_offset + len(bodies), len(packed))
+        bodies += packed
+
+    header = bytearray(0x48)
+    struct.pack_into('<4sxxxxH', header, 0, b'DxP2', len(textures))
+    struct.pack_into('<I', header, 0x10, block_1_offset - 0x10)
+    struct.pack_into('<I', header, 0x20, dds_block_offset - 0x10)
+    struct.pack_into('<I', header, 0x30, block_3_offset - 0x10)
+    padding = bytes(block_1_offset - names_end)
+    return bytes(header) + names + padding + bytes(0x8 * len(textures)) + dds_block + block_3 + bodies
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['dxp_unpack.py', *args])
+    dxp_unpack.main()
+
+
+def test_unpack(tmp_path, monkeypatch):
+    filename = tmp_path / 'textures.dxp.bin'
+    filename.write_bytes(build_dxp(textures))
+    run_main(monkeypatch, str(filename))
+    out_dir = tmp_path / 'textures.dxp.bin_u'
+    assert sorted(path.name for path in out_dir.iterdir()) == ['tex_a.ddsx', 'tex_b.ddsx', 'tex_c.ddsx']
+    ddsx = (out_dir / 'tex_b.ddsx').read_bytes()
+    assert ddsx[:4] == b'DDSx'
+    assert zlib.decompress(ddsx[0x20:]) == textures[1][1]
+
+
+def test_decode(tmp_path, monkeypatch):
+    filename = tmp_path / 'textures.dxp.bin'
+    filename.write_bytes(build_dxp(textures))
+    run_main(monkeypatch, str(filename), '--decode', '--jobs', '2')
+    out_dir = tmp_path / 'textures.dxp.bin_u'
+    assert sorted(path.name for path in out_dir.iterdir()) == ['tex_a.dds', 'tex_b.dds', 'tex_c.dds']
+    for name, body in textures:
+        dds = (out_dir / (name + '.dds')).read_bytes()
+        assert dds[:4] == b'DDS '
+        assert dds[0x80:] == body
+
+
+def test_archive(tmp_path):
+    filename = tmp_path / 'textures.dxp.bin'
+    filename.write_bytes(build_dxp(textures))
+    with DxpArchive(filename) as archive:
+        assert len(archive) == 3
+        assert archive.names() == ['tex_a', 'tex_b', 'tex_c']
+        assert archive.filenames == ['tex_a*suffix', 'tex_b*suffix', 'tex_c*suffix']
+        assert 'tex_b' in archive and 'tex_b*suffix' not in archive
+        header, body = archive.get('tex_b')
+        assert isinstance(body, memoryview)
+        assert header[:4] == b'DDSx'
+        assert zlib.decompress(body) == textures[1][1]
+        assert [(name, zlib.decompress(body)) for name, header, body in archive.iter_entries()] == textures
+        del header, body
+
+
+@pytest.mark.parametrize('data, error', [
+    (b'', 'empty file'),
+    (b'DxP1' + bytes(0x60), 'wrong dxp type'),
+    (b'DxP2' + bytes(0x10), 'size'),
+])
+def test_archive_not_dxp(tmp_path, data, error):
+    filename = tmp_path / 'textures.dxp.bin'
+    filename.write_bytes(data)
+    with pytest.raises(ValueError, match=error):
+        DxpArchive(filename)
+
+
+def test_archive_truncated_names(tmp_path):
+    filename = tmp_path / 'textures.dxp.bin'
+    data = bytearray(build_dxp(textures))
+    struct.pack_into('<H', data, 0x8, 100)
+    filename.write_bytes(data)
+    with pytest.raises(ValueError, match='names'):
+        DxpArchive(filename)
+
+
+def test_write_textures_bounded(tmp_path):
+    filename = tmp_path / 'textures.dxp.bin'
+    data = bytearray(build_dxp(textures))
+    # texture format of last texture
+    data[data.rindex(b'DDSx') + 4:data.rindex(b'DDSx') + 8] = b'ARGB'
+    filename.write_bytes(data)
+    dist_dir = str(tmp_path) + '/'
+    with DxpArchive(filename) as archive:
+        # budget lower than one texture, so textures are unpacked one by one
+        written_count, errors = dxp_unpack.write_textures(dist_dir, archive.iter_entries(), decode=True, jobs=2,
+                                                          max_in_flight_size=1)
+    assert written_count == 2
+    assert errors == [('tex_c', "Texture format b'ARGB' unsupported yet")]
+    for name, body in textures[:2]:
+        assert (tmp_path / (name + '.dds')).read_bytes()[0x80:] == body
@@ -0,0 +1,55 @@
+"""
+Startup time of tools: slow to import libraries should be imported only on first use, not with tool module.
+
+Also can be run from repo root, to print import time of tools and slowest imported modules:
+    python tests/test_import_time.py [tool ...]
+"""
+import os
+import subprocess
+import sys
+from typing import Dict
+
+import pytest
+
+TOOLS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'wt_tools')
+
+tools = ['ddsx_unpack', 'dxp_unpack', 'vromfs_unpacker', 'blk_unpack', 'blk_minify']
+
+# imported by tools only, when they are needed
+deferred_modules = ['lark', 'construct', 'zstandard', 'pylzma', 'multiprocessing', 'concurrent.futures']
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """
+    Import module in new interpreter with `-X importtime`, return cumulative import time of each imported module, in us.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], cwd=TOOLS_PATH,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        self_time, cumulative_time, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative_time)
+    return times
+
+
+@pytest.mark.parametrize('tool', tools)
+def test_deferred_imports(tool):
+    times = import_times(tool)
+    assert tool in times
+    assert [module for module in deferred_modules if module in times] == []
+
+
+def main():
+    for tool in sys.argv[1:] or tools:
+        times = min((import_times(tool) for _ in range(5)), key=lambda t: t[tool])
+        print('{}: {:.1f} ms'.format(tool, times[tool] / 1000))
+        slowest = sorted((t, name) for name, t in times.items() if '.' not in name and name != tool)[-5:]
+        for t, name in reversed(slowest):
+            print('    {}: {:.1f} ms'.format(name, t / 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import os
+
+import lark
+import pytest
+
+from src.wt_tools.formats import common
+
+blk_text = 'a:i=1\nb:t="str"\nobj{\n  c:p2=1, 2\n  empty{}\n}\n'
+minify_options = {'strip_empty_objects': True}
+
+
+@pytest.fixture
+def built(monkeypatch, tmp_path):
+    """
+    Count of parsers, built from grammar, with cache folder in tmp_path.
+    """
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    monkeypatch.setenv('LOCALAPPDATA', str(tmp_path))
+    count = []
+    lark_init = lark.Lark.__init__
+
+    def init(self, *args, **kwargs):
+        count.append(1)
+        lark_init(self, *args, **kwargs)
+
+    monkeypatch.setattr(lark.Lark, '__init__', init)
+    return count
+
+
+def load_parser():
+    return common.load_lark_parser('blk.lark', common.blk_transformer(minify_options), keep_all_tokens=True)
+
+
+def tables_paths():
+    tables_dir = os.path.join(common.get_cache_dir(), 'lark')
+    return [os.path.join(tables_dir, filename) for filename in os.listdir(tables_dir)]
+
+
+def test_tables_saved_and_loaded(built):
+    minified = load_parser().parse(blk_text)
+    assert minified == 'a:i=1;b:t="str";obj{c:p2=1,2;}'
+    assert len(built) == 1
+    assert [os.path.basename(path) for path in tables_paths()][0].startswith('blk-')
+
+    assert load_parser().parse(blk_text) == minified
+    assert len(built) == 1
+    # transformer isn't saved with tables
+    assert common.load_lark_parser('blk.lark', keep_all_tokens=True).parse(blk_text) != minified
+    assert len(built) == 1
+
+
+def test_tables_keyed_by_options(built):
+    load_parser()
+    common.load_lark_parser('blk.lark')
+    assert len(built) == 2
+    assert len(tables_paths()) == 2
+
+
+def test_broken_tables_rebuilt(built):
+    minified = load_parser().parse(blk_text)
+    tables_path, = tables_paths()
+    with open(tables_path, 'rb') as f:
+        tables = f.read()
+    with open(tables_path, 'wb') as f:
+        f.write(tables[:len(tables) // 2])
+
+    assert load_parser().parse(blk_text) == minified
+    assert len(built) == 2
+    assert load_parser().parse(blk_text) == minified
+    assert len(built) == 2
+
+
+def test_tables_not_saved(built, tmp_path):
+    # cache folder can't be created
+    (tmp_path / 'wt-tools').write_bytes(b'')
+    assert load_parser().parse(blk_text) == 'a:i=1;b:t="str";obj{c:p2=1,2;}'
+    assert load_parser().parse(blk_text) == 'a:i=1;b:t="str";obj{c:p2=1,2;}'
+    assert len(built) == 2
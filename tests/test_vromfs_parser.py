@@ -0,0 +1,113 @@
+import struct
+import zlib
+
+import pytest
+import zstandard
+
+from src.wt_tools.formats import vromfs_archive
+from src.wt_tools.formats.vromfs_archive import VromfsArchive, OBFS_KEY_HEAD, OBFS_KEY_TAIL
+from src.wt_tools.formats.vromfs_parser import vromfs_file
+
+
+def xor16(data, key):
+    return struct.pack("<4L", *[x ^ y for (x, y) in zip(struct.unpack("<4L", data), key)])
+
+
+def build_body(files):
+    """Build not packed vromfs body: header, names offsets, names, file data table, file data"""
+    names_table_offset = 0x20
+    names_offset = names_table_offset + 8 * len(files)
+    names = b''.join(name + b'\0' for name, _ in files)
+    file_data_table_offset = (names_offset + len(names) + 15) // 16 * 16
+    cur_p = file_data_table_offset + 16 * len(files)
+
+    name_offsets = []
+    records = []
+    file_data = b''
+    for name, data in files:
+        name_offsets.append(names_offset)
+        names_offset += len(name) + 1
+        records.append(struct.pack('<II8x', cur_p + len(file_data), len(data)))
+        file_data += data + b'\0' * (-len(data) % 16)
+
+    body = struct.pack('<II8xI', names_table_offset, len(files), file_data_table_offset).ljust(0x20, b'\0')
+    body += b''.join(struct.pack('<Q', offset) for offset in name_offsets) + names
+    body = body.ljust(file_data_table_offset, b'\0') + b''.join(records)
+    return body + file_data
+
+
+def build_vromfs(files, packed_type):
+    body = build_body(files)
+    if packed_type == 'not_packed':
+        payload, packed = body, 0x80 << 24
+    elif packed_type == 'zlib_packed':
+        payload = zlib.compress(body)
+        packed = 0x80 << 24 | len(payload)
+    else:
+        payload = bytearray(zstandard.ZstdCompressor().compress(body))
+        tail_offset = 16 + (len(payload) - 32) // 4 * 4
+        payload[:16] = xor16(payload[:16], OBFS_KEY_HEAD)
+        payload[tail_offset:tail_offset + 16] = xor16(payload[tail_offset:tail_offset + 16], OBFS_KEY_TAIL)
+        packed = 0xc0 << 24 | len(payload)
+    header = struct.pack('<4s4sII', b'VRFx', b'\0\0PC', len(body), packed) + struct.pack('<HHI', 8, 0, 34013242)
+    return header + bytes(payload) + b'\0' * 272
+
+
+test_files = [(b'buildtstamp', b'12345'), (b'/version', b'2.7.0.58'), (b'gamedata/units/a.blk', b'\x01blk' * 100),
+              (b'empty', b'')]
+test_files += [(('gamedata/units/b%d.blk' % i).encode(), bytes(range(i))) for i in range(50)]
+test_files += [(b'\xff?nm', b'nm')]
+
+
+@pytest.mark.parametrize('packed_type', ['not_packed', 'zlib_packed', 'zstd_packed'])
+def test_archive_tables_match_construct_parser(tmp_path, packed_type):
+    path = tmp_path / 'test.vromfs.bin'
+    path.write_bytes(build_vromfs(test_files, packed_type))
+
+    parsed = vromfs_file.parse(path.read_bytes()).body.data.data
+    with VromfsArchive(path) as archive:
+        assert archive.packed_type == packed_type
+        assert archive.is_new_version
+        assert archive.files_count == parsed.files_count
+        assert archive.filenames == [f.filename for f in parsed.filename_table.filenames]
+        for i, record in enumerate(parsed.file_data_table.file_data_list):
+            assert archive.size_of(i) == record.file_data_size
+            assert archive.get_by_index(i) == record.data
+        assert archive.get('version') == b'2.7.0.58'
+
+
+def test_archive_select(tmp_path):
+    path = tmp_path / 'test.vromfs.bin'
+    path.write_bytes(build_vromfs(test_files, 'not_packed'))
+
+    with VromfsArchive(path) as archive:
+        assert archive.select(['version', 'missing']) == [1]
+        assert archive.select(['gamedata/**/b4?.blk']) == list(range(44, 54))
+        assert archive.select(['gamedata/*.blk']) == []
+        assert archive.select(['gamedata/units/b1.blk'], ['.*/b4[0-4]\\.blk']) == [5] + list(range(44, 49))
+
+
+def test_zstd_body_streamed_by_chunks(tmp_path, monkeypatch):
+    # small chunks, so head, middle and tail parts are fed to decompressor by few chunks
+    monkeypatch.setattr(vromfs_archive, 'STREAM_CHUNK_SIZE', 7)
+    path = tmp_path / 'test.vromfs.bin'
+    path.write_bytes(build_vromfs(test_files, 'zstd_packed'))
+    not_packed_path = tmp_path / 'not_packed.vromfs.bin'
+    not_packed_path.write_bytes(build_vromfs(test_files, 'not_packed'))
+
+    with VromfsArchive(path) as archive, VromfsArchive(not_packed_path) as not_packed:
+        # decompressed body is mmapped temp file
+        assert archive._body_file is not None
+        assert len(archive._body) == archive.original_size
+        assert [bytes(data) for _, data in archive.iter_entries()] == \
+            [bytes(data) for _, data in not_packed.iter_entries()]
+
+
+def test_zstd_body_bigger_than_expected(tmp_path):
+    data = bytearray(build_vromfs(test_files, 'zstd_packed'))
+    # original size in header
+    struct.pack_into('<I', data, 8, struct.unpack_from('<I', data, 8)[0] - 1)
+    path = tmp_path / 'test.vromfs.bin'
+    path.write_bytes(data)
+    with pytest.raises(ValueError, match='bigger than expected'):
+        VromfsArchive(path)
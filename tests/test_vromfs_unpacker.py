@@ -0,0 +1,169 @@
+import os
+
+import pytest
+import zstandard
+
+import test_blk_unpack
+from test_vromfs_parser import build_vromfs
+from src.wt_tools import vromfs_unpacker
+
+zstd_dict_data = b'shared zstd dictionary of blk files ' * 4
+slim_data = test_blk_unpack.TestSlimBlk.slim_data
+name_map_data = test_blk_unpack.TestSlimBlk.name_map_data
+
+
+def zstd_compress(data):
+    zstd_dict = zstandard.ZstdCompressionDict(zstd_dict_data, dict_type=zstandard.DICT_TYPE_AUTO)
+    return zstandard.ZstdCompressor(dict_data=zstd_dict).compress(data)
+
+
+def build_files(readme=b'readme', with_b=True):
+    """
+    Files of new vromfs: shared zstd dict, slim blk files, packed with it, plain file and shared name map
+    """
+    files = [(b'test.dict', zstd_dict_data),
+             (b'gamedata/a.blk', b'\x05' + zstd_compress(slim_data))]
+    if with_b:
+        files.append((b'gamedata/sub/b.blk', b'\x04' + zstd_compress(slim_data)))
+    files.append((b'other/readme.txt', readme))
+    # name map is packed after 40 bytes of unknown header
+    files.append((b'\xff?nm', bytes(40) + zstd_compress(name_map_data)))
+    return files
+
+
+def write_vromfs(tmp_path, files, packed_type='zstd_packed'):
+    path = tmp_path / 'test.vromfs.bin'
+    path.write_bytes(build_vromfs(files, packed_type))
+    return str(path)
+
+
+def read_tree(dirname):
+    tree = {}
+    for root, dirs, files in os.walk(dirname):
+        for filename in files:
+            path = os.path.join(root, filename)
+            with open(path, 'rb') as f:
+                tree[os.path.relpath(path, dirname).replace(os.sep, '/')] = f.read()
+    return tree
+
+
+def changed_line(capsys) -> str:
+    return [line for line in capsys.readouterr().out.splitlines() if 'changed' in line][-1]
+
+
+def test_incremental(tmp_path, capsys):
+    out_dir = str(tmp_path / 'out')
+    vromfs_unpacker.unpack(write_vromfs(tmp_path, build_files()), out_dir, incremental=True)
+    assert changed_line(capsys) == '5 files changed, 0 removed, 0 unchanged'
+    assert os.path.isfile(vromfs_unpacker.get_manifest_path(out_dir))
+    # mark unpacked files, they are kept, if files are not unpacked again
+    for path in ('gamedata/a.blk', 'other/readme.txt'):
+        with open(os.path.join(out_dir, path), 'wb') as f:
+            f.write(b'kept')
+
+    vromfs_unpacker.unpack(write_vromfs(tmp_path, build_files()), out_dir, incremental=True)
+    assert changed_line(capsys) == '0 files changed, 0 removed, 5 unchanged'
+    assert read_tree(out_dir)['other/readme.txt'] == b'kept'
+
+    vromfs_unpacker.unpack(write_vromfs(tmp_path, build_files(readme=b'new readme')), out_dir, incremental=True)
+    assert changed_line(capsys) == '1 files changed, 0 removed, 4 unchanged'
+    tree = read_tree(out_dir)
+    assert tree['other/readme.txt'] == b'new readme'
+    assert tree['gamedata/a.blk'] == b'kept'
+
+    vromfs_unpacker.unpack(write_vromfs(tmp_path, build_files(readme=b'new readme', with_b=False)), out_dir,
+                           incremental=True)
+    assert changed_line(capsys) == '0 files changed, 1 removed, 4 unchanged'
+    assert 'gamedata/sub/b.blk' not in read_tree(out_dir)
+    assert not os.path.exists(os.path.join(out_dir, 'gamedata', 'sub'))
+
+
+def test_incremental_selected_files(tmp_path, capsys):
+    out_dir = str(tmp_path / 'out')
+    filename = write_vromfs(tmp_path, build_files())
+    vromfs_unpacker.unpack(filename, out_dir, incremental=True, selectors=['other/*'])
+    assert changed_line(capsys) == '1 files changed, 0 removed, 0 unchanged'
+    # shared dict isn't selected, but it's stored in manifest, so files aren't unpacked again
+    vromfs_unpacker.unpack(filename, out_dir, incremental=True, selectors=['other/*'])
+    assert changed_line(capsys) == '0 files changed, 0 removed, 1 unchanged'
+    assert list(read_tree(out_dir)) == ['other/readme.txt']
+
+
+def test_incremental_shared_dict_changed(tmp_path, capsys):
+    out_dir = str(tmp_path / 'out')
+    files = build_files()
+    vromfs_unpacker.unpack(write_vromfs(tmp_path, files), out_dir, incremental=True, selectors=['other/*'])
+    capsys.readouterr()
+    files[0] = (b'test.dict', zstd_dict_data + b'new')
+    vromfs_unpacker.unpack(write_vromfs(tmp_path, files), out_dir, incremental=True, selectors=['other/*'])
+    assert changed_line(capsys) == '1 files changed, 0 removed, 0 unchanged'
+
+
+@pytest.mark.parametrize('decode_blk_type', [None, vromfs_unpacker.BLK.output_type['json']])
+def test_parallel_unpack_same_as_serial(tmp_path, decode_blk_type):
+    files = build_files()
+    files[-1:-1] = [('gamedata/c{}.blk'.format(i).encode(), b'\x05' + zstd_compress(slim_data)) for i in range(30)]
+    files[-1:-1] = [('other/{}.bin'.format(i).encode(), bytes(range(i))) for i in range(30)]
+    filename = write_vromfs(tmp_path, files)
+    vromfs_unpacker.unpack(filename, str(tmp_path / 'serial'), decode_blk_type=decode_blk_type)
+    vromfs_unpacker.unpack(filename, str(tmp_path / 'parallel'), jobs=4, decode_blk_type=decode_blk_type)
+    serial = read_tree(tmp_path / 'serial')
+    assert len(serial) == len(files)
+    if decode_blk_type is None:
+        assert serial['gamedata/c0.blk'] == slim_data
+    else:
+        assert serial['gamedata/c0.blkx'].startswith(b'{')
+    assert read_tree(tmp_path / 'parallel') == serial
+
+
+@pytest.mark.parametrize('keep_raw', [False, True])
+def test_decode_blk(tmp_path, capsys, keep_raw):
+    files = build_files()
+    files[-1:-1] = [(b'gamedata/text.blk', b'a:i=1\n'), (b'gamedata/bad.blk', b'\x07\x00\x01\x02\x03')]
+    out_dir = tmp_path / 'out'
+    vromfs_unpacker.unpack(write_vromfs(tmp_path, files), str(out_dir),
+                           decode_blk_type=vromfs_unpacker.BLK.output_type['json_min'], keep_raw=keep_raw)
+    tree = read_tree(out_dir)
+    assert tree['gamedata/a.blkx'] == b'{"a":1,"b":"blk","blk":{"a":0.5}}'
+    assert tree['gamedata/sub/b.blkx'] == tree['gamedata/a.blkx']
+    # text blk is written as is
+    assert tree['gamedata/text.blkx'] == b'a:i=1\n'
+    # not decoded blk is written raw
+    assert tree['gamedata/bad.blk'] == b'\x07\x00\x01\x02\x03'
+    assert 'gamedata/bad.blkx' not in tree
+    assert 'gamedata/bad.blk: Unknown file type' in capsys.readouterr().out
+    assert tree['other/readme.txt'] == b'readme'
+    if keep_raw:
+        assert tree['gamedata/a.blk'] == slim_data
+    else:
+        assert sorted(path for path in tree if path.endswith('.blk')) == ['gamedata/bad.blk']
+
+
+def corrupted_blk(offset, value):
+    # fat blk `{"a":1,"b":"str"}` with one changed byte
+    data = bytearray.fromhex('00424246030000000000000000410201610162000100004001037374720000000200000006000002070000'
+                             '010100000000000000')
+    data[offset] = value
+    return bytes(data)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_decode_corrupted_blk(tmp_path, capsys, jobs):
+    files = build_files()
+    # unknown name id, name of not utf-8
+    broken = [(b'gamedata/broken_name_id.blk', corrupted_blk(36, 5)),
+              (b'gamedata/broken_name.blk', corrupted_blk(16, 0xff))]
+    files[-1:-1] = broken
+    out_dir = str(tmp_path / 'out')
+    vromfs_unpacker.unpack(write_vromfs(tmp_path, files), out_dir, jobs=jobs, incremental=True,
+                           decode_blk_type=vromfs_unpacker.BLK.output_type['json_min'])
+    out = capsys.readouterr().out
+    assert 'gamedata/broken_name_id.blk: KeyError' in out
+    assert 'gamedata/broken_name.blk: UnicodeDecodeError' in out
+    tree = read_tree(out_dir)
+    for path, data in broken:
+        assert tree[path.decode()] == data
+    assert tree['gamedata/a.blkx'] == b'{"a":1,"b":"blk","blk":{"a":0.5}}'
+    assert tree['gamedata/sub/b.blkx'] == tree['gamedata/a.blkx']
+    assert tree['other/readme.txt'] == b'readme'
+    assert os.path.isfile(vromfs_unpacker.get_manifest_path(out_dir))